@@ -1,11 +1,70 @@
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, Response, abort, g, jsonify, request
+import io
 import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import assets
+import cache
+import coalesce
+import columnar
+import depgraph
+import dynamics
+import engine
+import lakegrid
+import metrics
+import models
+import montecarlo
+import narrative
+import particles
+import profiler
+import sensitivity
+import sweep
+import table
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 app = Flask(__name__)
+app.config['INDICATOR_TABLE'] = os.environ.get('TRAPA_INDICATOR_TABLE', table.DEFAULT_PATH)
+app.config['MICROBE_CELLS'] = int(os.environ.get('TRAPA_MICROBE_CELLS', 200000))
+app.config['MICROBE_SYSTEMS'] = 8
+# Merge single-scenario requests arriving within this many milliseconds; 0 disables
+app.config['COALESCE_WINDOW_MS'] = float(os.environ.get('TRAPA_COALESCE_MS', 0))
+# Profile every /api/calculate call and keep stacks of those slower than this; unset disables
+app.config['PROFILE_SLOW_MS'] = os.environ.get('TRAPA_PROFILE_SLOW_MS')
+# Let clients ask for a profile of their request with an X-Profile header
+app.config['PROFILE_HEADER'] = os.environ.get('TRAPA_PROFILE_HEADER') == '1'
+app.config['PROFILE_DIR'] = os.environ.get('TRAPA_PROFILE_DIR', 'profiles')
+# Entries in each worker's single-scenario result cache; 0 disables it
+app.config['RESULT_CACHE_SIZE'] = int(os.environ.get('TRAPA_RESULT_CACHE_SIZE', 65536))
+# Directory of the result tier shared by all workers on the host; unset disables it
+app.config['SHARED_CACHE_DIR'] = os.environ.get('TRAPA_SHARED_CACHE_DIR')
+# Largest lake raster /api/lake scores in one request; bigger lakes go through the lakegrid CLI
+app.config['LAKE_MAX_CELLS'] = int(os.environ.get('TRAPA_LAKE_MAX_CELLS', 1 << 22))
 
-@app.route('/')
-def index():
-    return render_template_string('''
+_model = None
+_coalescer = None
+_coalescer_lock = threading.Lock()
+_particle_systems = {}
+_particle_systems_lock = threading.Lock()
+_result_cache = None
+
+
+def get_model():
+    """The precomputed table when one is built for this model, else the live engine."""
+    global _model
+    if _model is None or (_model is not engine and _model.version != engine.model_version()):
+        # Coefficients changed since the table was opened
+        _model = table.open_table(app.config['INDICATOR_TABLE']) or engine
+    return _model
+
+INDEX_TEMPLATE = '''
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -450,13 +509,368 @@ def index():
     </script>
 </body>
 </html>
-''')
+'''
+
+# The page has no per-request variables: render and compress it once at startup
+INDEX_PAGE = assets.Asset(app.jinja_env.from_string(INDEX_TEMPLATE).render(), 'text/html')
+STATIC_ASSETS, STATIC_NAMES = assets.load_static()
+with open(os.path.join(assets.ROOT, 'index.html'), encoding='utf-8') as f:
+    STANDALONE_PAGE = assets.Asset(assets.rewrite_references(f.read(), STATIC_NAMES), 'text/html')
+
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None and app.config['RESULT_CACHE_SIZE'] > 0:
+        shared = app.config['SHARED_CACHE_DIR']
+        _result_cache = cache.ResultCache(app.config['RESULT_CACHE_SIZE'],
+                                          cache.SharedTier(shared) if shared else None)
+    return _result_cache
+
+
+def get_coalescer():
+    global _coalescer
+    if _coalescer is None and app.config['COALESCE_WINDOW_MS'] > 0:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = coalesce.Coalescer(lambda **inputs: get_model().calculate_indicators(**inputs),
+                                                window=app.config['COALESCE_WINDOW_MS'] / 1000)
+    return _coalescer
+
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+    if request.endpoint != 'calculate':
+        return
+    forced = app.config['PROFILE_HEADER'] and request.headers.get('X-Profile') == '1'
+    if forced or app.config['PROFILE_SLOW_MS'] is not None:
+        g.profile_forced = forced
+        g.profiler = profiler.SamplingProfiler().start()
+
+@app.after_request
+def record_request(response):
+    # Streaming responses are timed up to the first byte
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.get('started', time.perf_counter()), route=route)
+    metrics.REQUESTS.inc(route=route, status=response.status_code)
+    sampler = g.pop('profiler', None)
+    if sampler is not None:
+        sampler.stop()
+        threshold = app.config['PROFILE_SLOW_MS']
+        slow = threshold is not None and sampler.elapsed * 1000 >= float(threshold)
+        if g.profile_forced or slow:
+            path = sampler.dump(app.config['PROFILE_DIR'], 'calculate')
+            if g.profile_forced:
+                response.headers['X-Profile-File'] = path
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/')
+def index():
+    return INDEX_PAGE.response()
+
+@app.route('/index.html')
+def standalone_index():
+    return STANDALONE_PAGE.response()
+
+@app.route('/assets/<name>')
+def static_asset(name):
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        abort(404)
+    return asset.response(assets.IMMUTABLE)
 
 @app.route('/api/calculate', methods=['POST'])
 def calculate():
-    data = request.get_json()
-    # Add backend calculation if needed
-    return jsonify({'status': 'success'})
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'uncertainty' in data:
+        return calculate_uncertainty(data)
+    if isinstance(data, dict) and 'models' in data:
+        return calculate_models(data)
+    try:
+        inputs, single = engine.parse_scenarios(data)
+        inputs = engine.validate_inputs(inputs)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    metrics.BATCH_SIZE.observe(len(inputs['season']), route='/api/calculate')
+    if single:
+        result = calculate_one(inputs)
+        if wants_columnar():
+            return Response(columnar.encode({name: [value] for name, value in result.items()}),
+                            mimetype=columnar.MIMETYPE)
+        return jsonify({'status': 'success', 'indicators': result})
+
+    indicators = get_model().calculate_indicators(**inputs)
+    if wants_columnar():
+        return Response(columnar.encode(indicators), mimetype=columnar.MIMETYPE)
+    # Batches come back columnar: one list per indicator, in input order
+    result = {name: np.round(values, engine.OUTPUT_DECIMALS).tolist() for name, values in indicators.items()}
+    count = len(next(iter(indicators.values())))
+    return jsonify({'status': 'success', 'count': count, 'indicators': result})
+
+def wants_columnar():
+    return request.accept_mimetypes.best_match(['application/json', columnar.MIMETYPE]) == columnar.MIMETYPE
+
+def calculate_one(inputs):
+    """Indicators of a single scenario through the result cache and the coalescer."""
+    scenario = cache.normalize(tuple(inputs[key][0].item() for key in engine.INPUTS))
+    results = get_result_cache()
+    result = results.get(scenario) if results is not None else None
+    if result is not None:
+        return result
+
+    coalescer = get_coalescer()
+    if coalescer is not None:
+        result = coalescer.calculate(scenario)
+    else:
+        indicators = get_model().calculate_indicators(
+            **{key: np.asarray([value]) for key, value in zip(engine.INPUTS, scenario)})
+        result = {name: float(values[0]) for name, values in indicators.items()}
+    result = {name: round(value, engine.OUTPUT_DECIMALS) for name, value in result.items()}
+    if results is not None:
+        results.put(scenario, result)
+    return result
+
+def calculate_models(data):
+    """Score the payload with each model listed in ``models``, side by side."""
+    names = data['models']
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        return jsonify({'status': 'error', 'message': 'models must be a list of model names'}), 400
+    try:
+        inputs, single = engine.parse_scenarios(data)
+        inputs = engine.validate_inputs(inputs)
+        results = models.evaluate(inputs, names)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    metrics.BATCH_SIZE.observe(len(inputs['season']), route='/api/calculate')
+    if wants_columnar():
+        return Response(columnar.encode({f'{name}.{key}': values for name, indicators in results.items()
+                                         for key, values in indicators.items()}),
+                        mimetype=columnar.MIMETYPE)
+    if single:
+        result = {name: {key: float(values[0]) for key, values in indicators.items()}
+                  for name, indicators in results.items()}
+        return jsonify({'status': 'success', 'models': result})
+    result = {name: {key: values.tolist() for key, values in indicators.items()}
+              for name, indicators in results.items()}
+    return jsonify({'status': 'success', 'count': len(inputs['season']), 'models': result})
+
+def calculate_uncertainty(data):
+    options = data['uncertainty'] or {}
+    if not isinstance(options, dict):
+        return jsonify({'status': 'error', 'message': 'uncertainty must be an object'}), 400
+    scenario = {key: data[key] for key in engine.INPUTS if key in data}
+    try:
+        seed = options.get('seed')
+        result = montecarlo.run(
+            scenario,
+            options.get('distributions', {}),
+            int(options.get('samples', 10000)),
+            seed=None if seed is None else int(seed),
+            percentiles=[float(p) for p in options.get('percentiles', montecarlo.DEFAULT_PERCENTILES)],
+            bins=int(options.get('bins', montecarlo.DEFAULT_BINS)),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', **result})
+
+@app.route('/api/narrative', methods=['POST'])
+def narratives():
+    data = request.get_json(silent=True)
+    fmt = data.get('format', 'html') if isinstance(data, dict) else 'html'
+    try:
+        inputs, single = engine.parse_scenarios(data)
+        inputs = engine.validate_inputs(inputs)
+        texts, buckets = narrative.render(inputs, get_model().calculate_indicators(**inputs), fmt)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    metrics.BATCH_SIZE.observe(len(texts), route='/api/narrative')
+    if single:
+        return jsonify({'status': 'success', 'narrative': texts[0], 'bucket': int(buckets[0])})
+    return jsonify({'status': 'success', 'count': len(texts), 'narratives': texts, 'buckets': buckets.tolist()})
+
+@app.route('/api/sweep', methods=['POST'])
+def sweep_grid():
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'expected a sweep request object'}), 400
+    fmt = data.get('format', 'binary' if wants_columnar() else 'ndjson')
+    try:
+        axes = sweep.parse_axes(data.get('axes'))
+        chunk_size = int(data.get('chunkSize', sweep.DEFAULT_CHUNK_SIZE))
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if not 0 < chunk_size <= sweep.MAX_CHUNK_SIZE:
+        return jsonify({'status': 'error', 'message': 'chunkSize out of range'}), 400
+
+    metrics.BATCH_SIZE.observe(sweep.grid_size(axes), route='/api/sweep')
+    headers = {'X-Sweep-Rows': str(sweep.grid_size(axes))}
+    if fmt == 'ndjson':
+        return Response(sweep.ndjson_lines(axes, chunk_size),
+                        mimetype='application/x-ndjson', headers=headers)
+    if fmt == 'binary':
+        headers['X-Sweep-Columns'] = ','.join(sweep.COLUMNS)
+        return Response(sweep.binary_frames(axes, chunk_size), mimetype=columnar.MIMETYPE, headers=headers)
+    return jsonify({'status': 'error', 'message': f'unknown format: {fmt}'}), 400
+
+@app.route('/api/sensitivity', methods=['POST'])
+def sensitivity_analysis():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'expected a sensitivity request object'}), 400
+    scenario = {key: data[key] for key in engine.INPUTS if key in data}
+    try:
+        seed = data.get('seed')
+        result = sensitivity.sobol(
+            scenario,
+            int(data.get('samples', 10000)),
+            factors=data.get('factors'),
+            ranges=data.get('ranges'),
+            seed=None if seed is None else int(seed),
+        )
+        result['gradients'] = sensitivity.gradients(scenario, data.get('factors'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    metrics.BATCH_SIZE.observe(result['evaluations'], route='/api/sensitivity')
+    return jsonify({'status': 'success', **result})
+
+@app.route('/api/dynamics', methods=['GET', 'POST'])
+def dynamics_stream():
+    # GET takes a single scenario as query parameters so EventSource can connect
+    data = request.get_json(silent=True) if request.method == 'POST' else request.args.to_dict()
+    data = data or {}
+    try:
+        days = int(data.pop('days', dynamics.DAYS_PER_YEAR)) if isinstance(data, dict) else dynamics.DAYS_PER_YEAR
+        batch_days = int(data.pop('batchDays', 30)) if isinstance(data, dict) else 30
+        start_day = int(data.pop('startDay', 0)) if isinstance(data, dict) else 0
+        inputs, _ = engine.parse_scenarios(data)
+        inputs = engine.validate_inputs(inputs)
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if not (0 < days <= 10 * dynamics.DAYS_PER_YEAR and 0 < batch_days <= days):
+        return jsonify({'status': 'error', 'message': 'days or batchDays out of range'}), 400
+
+    inputs.pop('season')  # the season follows the calendar
+    sim = dynamics.Simulation(**inputs, start_day=start_day)
+
+    def events():
+        for day, state in sim.run(days, batch_days):
+            payload = {'day': day.tolist(), 'season': [engine.SEASONS[i] for i in dynamics.day_season(day)]}
+            payload.update((key, values.tolist()) for key, values in state.items())
+            yield f'event: step\ndata: {json.dumps(payload)}\n\n'
+        yield 'event: done\ndata: {}\n\n'
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/lake', methods=['POST'])
+def lake():
+    # Rasters come as JSON nested lists or, for larger lakes, as an .npz upload
+    if request.mimetype == 'application/x-npz':
+        data = request.args.to_dict()
+        try:
+            with np.load(io.BytesIO(request.get_data()), allow_pickle=False) as arrays:
+                data.update((key, arrays[key]) for key in ('chestnutCoverage', 'waterDepth') if key in arrays)
+        except (OSError, ValueError):
+            return jsonify({'status': 'error', 'message': 'unreadable npz upload'}), 400
+    else:
+        data = request.get_json(silent=True)
+    try:
+        options = lakegrid.parse_lake(data)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    shape = np.broadcast_shapes(options['coverage'].shape, options['depth'].shape)
+    if not 0 <= options['steps'] <= 1000:
+        return jsonify({'status': 'error', 'message': 'steps out of range'}), 400
+    if shape[0] * shape[1] > app.config['LAKE_MAX_CELLS']:
+        return jsonify({'status': 'error', 'message': 'lake raster too large'}), 400
+
+    metrics.BATCH_SIZE.observe(shape[0] * shape[1], route='/api/lake')
+    rasters = lakegrid.run(**options)
+    headers = {'X-Lake-Shape': f'{shape[0]},{shape[1]}'}
+    if wants_columnar():
+        # Columns are the rasters flattened row by row
+        return Response(columnar.encode({name: raster.ravel() for name, raster in rasters.items()}),
+                        mimetype=columnar.MIMETYPE, headers=headers)
+    result = {name: np.round(raster.astype(float), 4).tolist() for name, raster in rasters.items()}
+    return jsonify({'status': 'success', 'shape': list(shape), 'indicators': result}), 200, headers
+
+def get_particle_system(inputs):
+    """Particle population for one scenario, kept for the next microscope queries."""
+    key = tuple(float(inputs[name][0]) for name in engine.INPUTS)
+    with _particle_systems_lock:
+        system = _particle_systems.pop(key, None)
+        if system is not None:
+            _particle_systems[key] = system  # reinsert as most recently used
+    metrics.CACHE_LOOKUPS.inc(cache='particles', result='miss' if system is None else 'hit')
+    if system is None:
+        indicators = get_model().calculate_indicators(**inputs)
+        system = particles.for_scenario(indicators['microbialBiomass'][0], indicators['dissolvedOxygen'][0],
+                                        inputs['waterMovement'][0], app.config['MICROBE_CELLS'])
+        with _particle_systems_lock:
+            _particle_systems.pop(key, None)
+            while _particle_systems and len(_particle_systems) >= app.config['MICROBE_SYSTEMS']:
+                _particle_systems.pop(next(iter(_particle_systems)))
+            _particle_systems[key] = system
+    return system
+
+@app.route('/api/microbes')
+def microbes():
+    args = request.args.to_dict()
+    try:
+        x = float(args.pop('x', 0.5))
+        y = float(args.pop('y', 0.5))
+        r = float(args.pop('r', 0.05))
+        magnification = float(args.pop('magnification', 1))
+        limit = int(args.pop('limit', 5000))
+        inputs, _ = engine.parse_scenarios(args)
+        inputs = engine.validate_inputs(inputs)
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if not np.isfinite([x, y, r, magnification]).all():
+        return jsonify({'status': 'error', 'message': 'x, y, r and magnification must be finite'}), 400
+    if r <= 0 or magnification <= 0 or limit < 0:
+        return jsonify({'status': 'error', 'message': 'r, magnification and limit must be positive'}), 400
+
+    system = get_particle_system(inputs)
+    body = particles.encode_query(*system.microscope(x, y, r, magnification, limit))
+    return Response(body, mimetype='application/octet-stream',
+                    headers={'X-Microbes-Total': str(len(system))})
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/api/session')
+    def session_socket(ws):
+        """Per-client model state; each message of input changes gets back only the changed indicators."""
+        try:
+            session = depgraph.Session(request.args.to_dict())
+        except ValueError as e:
+            ws.send(json.dumps({'status': 'error', 'message': str(e)}))
+            return
+        ws.send(json.dumps({'indicators': session.indicators}))
+        while True:
+            message = ws.receive()
+            if message is None:
+                return
+            try:
+                changes = json.loads(message)
+                if not isinstance(changes, dict):
+                    raise ValueError('expected an object of input changes')
+                changed = session.update(changes)
+            except ValueError as e:
+                ws.send(json.dumps({'status': 'error', 'message': str(e)}))
+                continue
+            if changed:
+                ws.send(json.dumps({'changed': changed}))
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
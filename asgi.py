@@ -0,0 +1,11 @@
+"""ASGI entry point: ``uvicorn asgi:asgi_app --workers 4``.
+
+Flask stays a WSGI app; ``asgiref`` runs its handlers on a thread pool, which
+is what lets concurrent /api/calculate requests meet in the coalescer (set
+``TRAPA_COALESCE_MS``).
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+
+asgi_app = WsgiToAsgi(app)
@@ -0,0 +1,86 @@
+"""Precompressed in-memory delivery of the page and static files.
+
+Each asset is rendered once, compressed once (gzip, plus brotli when the
+``brotli`` package is installed) and served from memory with a strong ETag
+per encoding.  Static files get content-hashed names so browsers can cache
+them forever.
+"""
+import gzip
+import hashlib
+import os
+import re
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Files served under /assets/ with content-hashed names
+STATIC_FILES = {
+    'columnar.js': 'application/javascript',
+    'simulation.js': 'application/javascript',
+    'styles.css': 'text/css',
+}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class Asset:
+    """One response body in every encoding we serve."""
+
+    def __init__(self, body, mimetype):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.encodings = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body, quality=11)
+        self.etags = {name: f'{self.digest[:32]}-{name}' for name in self.encodings}
+
+    def choose_encoding(self, accept_encoding):
+        for name in ('br', 'gzip'):
+            if name in self.encodings and accept_encoding[name]:
+                return name
+        return 'identity'
+
+    def response(self, cache_control=REVALIDATE):
+        encoding = self.choose_encoding(request.accept_encodings)
+        etag = self.etags[encoding]
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.encodings[encoding], mimetype=self.mimetype, headers=headers)
+
+
+def hashed_name(name, digest):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{digest[:12]}{ext}'
+
+
+def load_static(root=ROOT):
+    """Read static files once; returns ``(assets by hashed name, hashed name by file name)``."""
+    assets, names = {}, {}
+    for name, mimetype in STATIC_FILES.items():
+        with open(os.path.join(root, name), 'rb') as f:
+            asset = Asset(f.read(), mimetype)
+        names[name] = hashed_name(name, asset.digest)
+        assets[names[name]] = asset
+    return assets, names
+
+
+def rewrite_references(html, names, prefix='/assets/'):
+    """Point src/href attributes at the hashed static names."""
+    def replace(match):
+        name = match.group(2)
+        if name not in names:
+            return match.group(0)
+        return f'{match.group(1)}="{prefix}{names[name]}"'
+    return re.sub(r'\b(src|href)="([^"]+)"', replace, html)
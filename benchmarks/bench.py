@@ -0,0 +1,253 @@
+"""Benchmarks and load harness for the backend.
+
+    python benchmarks/bench.py run [--quick] [--url URL] [-o results.json]
+    python benchmarks/bench.py compare baseline.json results.json [--threshold 0.1]
+
+``run`` times the engine, the endpoints through the Flask test client, and a
+local HTTP load test, and writes the numbers to a JSON file.  ``compare``
+prints both files side by side and exits non-zero when any benchmark got
+worse by more than the threshold.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+import engine  # noqa: E402
+import sweep  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+SCENARIO = {'waterDepth': 2.5, 'chestnutCoverage': 60, 'nutrientLevel': 6, 'waterMovement': 3, 'season': 'fall'}
+
+
+def timed(fn, repeat=5, number=1):
+    """Median and best seconds per call over ``repeat`` rounds of ``number`` calls."""
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    return {'value': statistics.median(rounds), 'best': min(rounds), 'unit': 's', 'better': 'lower'}
+
+
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        'waterDepth': np.round(rng.uniform(0.5, 5, n), 1),
+        'chestnutCoverage': rng.integers(0, 101, n).astype(float),
+        'nutrientLevel': rng.integers(1, 11, n).astype(float),
+        'waterMovement': rng.integers(1, 11, n).astype(float),
+        'season': rng.integers(0, 4, n),
+    }
+
+
+def micro_benchmarks(quick):
+    results = {}
+    single = {key: np.asarray([value]) for key, value in SCENARIO.items()}
+    results['engine.single'] = timed(lambda: engine.calculate_indicators(**single), number=1000)
+    for n in (10 ** 3, 10 ** 6):
+        inputs = random_inputs(n)
+        results[f'engine.batch_{n}'] = timed(lambda: engine.calculate_indicators(**inputs),
+                                             repeat=3 if n > 10 ** 3 else 5, number=1 if n > 10 ** 3 else 100)
+        results[f'engine.batch_{n}']['perScenario'] = results[f'engine.batch_{n}']['value'] / n
+
+    axes = sweep.full_grid()
+    if quick:
+        axes['waterDepth'] = axes['waterDepth'][:5]
+
+    def full_sweep():
+        for _ in sweep.iter_chunks(axes):
+            pass
+    results['engine.sweep'] = timed(full_sweep, repeat=1 if quick else 3)
+    results['engine.sweep']['scenarios'] = sweep.grid_size(axes)
+    return results
+
+
+def endpoint_benchmarks():
+    from app import app
+    client = app.test_client()
+    batch = [dict(SCENARIO, chestnutCoverage=i % 101) for i in range(1000)]
+    return {
+        'endpoint.index': timed(lambda: client.get('/', headers={'Accept-Encoding': 'gzip'}), number=200),
+        'endpoint.calculate_single': timed(lambda: client.post('/api/calculate', json=SCENARIO), number=200),
+        'endpoint.calculate_batch_1000': timed(lambda: client.post('/api/calculate', json=batch), number=10),
+    }
+
+
+def start_server():
+    """Serve the app on a free local port from a background thread."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from app import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def load_test(url, concurrency, requests_per_client):
+    """Hammer ``/api/calculate`` from ``concurrency`` keep-alive clients."""
+    target = urllib.parse.urlsplit(url)
+    latencies = [[] for _ in range(concurrency)]
+    errors = []
+    barrier = threading.Barrier(concurrency + 1)
+
+    def client(slot):
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+        rng = np.random.default_rng(slot)
+        barrier.wait()
+        for _ in range(requests_per_client):
+            body = json.dumps(dict(SCENARIO, chestnutCoverage=int(rng.integers(0, 101))))
+            start = time.perf_counter()
+            try:
+                conn.request('POST', '/api/calculate', body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(str(e))
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+            latencies[slot].append(time.perf_counter() - start)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = np.concatenate([np.asarray(slot) for slot in latencies])
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        'value': len(samples) / elapsed, 'unit': 'req/s', 'better': 'higher',
+        'p50': p50, 'p95': p95, 'p99': p99, 'requests': len(samples), 'errors': len(errors),
+    }
+
+
+def load_benchmarks(url, quick):
+    server = None
+    if url is None:
+        server, url = start_server()
+    try:
+        results = {}
+        for concurrency in (1, 8, 32):
+            count = 50 if quick else 200
+            results[f'load.c{concurrency}'] = load_test(url, concurrency, count)
+        return results
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+def run(args):
+    results = {}
+    results.update(micro_benchmarks(args.quick))
+    results.update(endpoint_benchmarks())
+    results.update(load_benchmarks(args.url, args.quick))
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'modelVersion': engine.model_version(),
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f'{stamp}.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, default=float)
+    for name, result in results.items():
+        print(f'{name:32} {format_value(result)}')
+    print(f'\nSaved {output}')
+
+
+def format_value(result, latency=True):
+    if result['unit'] == 's':
+        return f'{result["value"] * 1e3:12.4f} ms'
+    extra = ''
+    if latency and 'p50' in result:
+        extra = (f'  p50 {result["p50"] * 1e3:.2f} ms  p95 {result["p95"] * 1e3:.2f} ms'
+                 f'  p99 {result["p99"] * 1e3:.2f} ms')
+    return f'{result["value"]:12.1f} {result["unit"]}{extra}'
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        old, new = baseline[name]['value'], current[name]['value']
+        if current[name]['better'] == 'lower':
+            change = new / old - 1
+        else:
+            change = old / new - 1
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:32} {format_value(baseline[name], False)} -> {format_value(current[name], False)}'
+              f'  {0.0 - change:+.1%}{flag}')
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f'{name:32} only in {"baseline" if name in baseline else "current"}')
+
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) beyond {args.threshold:.0%}')
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run all benchmarks and save the results')
+    run_parser.add_argument('-o', '--output', help='results file (default: benchmarks/results/<timestamp>.json)')
+    run_parser.add_argument('--url', help='load-test a running server instead of starting one')
+    run_parser.add_argument('--quick', action='store_true', help='smaller sweep and load test')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='flag regressions between two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='relative slowdown counted as a regression (default 0.1)')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
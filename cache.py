@@ -0,0 +1,149 @@
+"""Result cache for single-scenario calculations.
+
+Slider input repeats heavily, so scenarios are normalized to their slider
+step and cached per model version.  The in-process tier is a bounded LRU;
+the optional shared tier is a fixed-size, direct-mapped table in a
+memory-mapped file that every worker on the host reads and writes.  Both
+tiers are keyed on ``engine.model_version()``, so changing coefficients
+invalidates them without any explicit flush.
+"""
+import collections
+import hashlib
+import math
+import os
+import struct
+import threading
+
+import numpy as np
+
+import engine
+import metrics
+import sweep
+
+# Inputs within this distance of a slider step are snapped onto it
+SNAP_TOLERANCE = 1e-6
+
+SHARED_RECORD = np.dtype([('key', '<u8'), ('values', '<f8', len(engine.INDICATORS)), ('check', '<u8')])
+
+
+def normalize(scenario):
+    """Snap a scenario tuple (engine.INPUTS order, season index) onto the slider grid.
+
+    Off-grid values are kept, rounded to SNAP_TOLERANCE, so they never
+    share an entry with a neighbouring grid point.
+    """
+    out = []
+    for key, value in zip(engine.INPUTS[:-1], scenario[:-1]):
+        low, _, step = sweep.SLIDERS[key]
+        index = (value - low) / step
+        # Values too large for a step index cannot be on the grid
+        snapped = round(low + round(index) * step, 10) if math.isfinite(index) else value
+        out.append(float(snapped) if abs(snapped - value) < SNAP_TOLERANCE else round(value, 6))
+    out.append(int(scenario[-1]))
+    return tuple(out)
+
+
+class ResultCache:
+    """Bounded LRU of indicator dicts with an optional shared second tier."""
+
+    def __init__(self, maxsize=65536, shared=None):
+        self.maxsize = maxsize
+        self.shared = shared
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.version = engine.model_version()
+
+    def _check_version(self):
+        version = engine.model_version()
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        return version
+
+    def get(self, key):
+        with self.lock:
+            version = self._check_version()
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+        if result is not None:
+            metrics.CACHE_LOOKUPS.inc(cache='results', result='hit')
+            return result
+        if self.shared is not None:
+            result = self.shared.get(version, key)
+            if result is not None:
+                metrics.CACHE_LOOKUPS.inc(cache='results', result='shared_hit')
+                self._store(key, result)
+                return result
+        metrics.CACHE_LOOKUPS.inc(cache='results', result='miss')
+        return None
+
+    def put(self, key, result):
+        self._store(key, result)
+        if self.shared is not None:
+            self.shared.put(engine.model_version(), key, result)
+
+    def _store(self, key, result):
+        with self.lock:
+            self._check_version()
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+class SharedTier:
+    """Direct-mapped result table in a memory-mapped file, one file per model version.
+
+    Each record holds a key hash, the indicator values and a checksum over
+    both; a reader that catches a record mid-write sees a bad checksum and
+    treats it as a miss, so no cross-process lock is needed.
+    """
+
+    def __init__(self, directory, slots=1 << 18):
+        self.directory = directory
+        self.slots = slots
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def _table(self, version):
+        table = self.tables.get(version)
+        if table is None:
+            with self.lock:
+                table = self.tables.get(version)
+                if table is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    path = os.path.join(self.directory, f'results-{version}.bin')
+                    size = self.slots * SHARED_RECORD.itemsize
+                    with open(path, 'ab') as f:
+                        if f.tell() < size:
+                            f.truncate(size)
+                    table = self.tables[version] = np.memmap(path, dtype=SHARED_RECORD, mode='r+',
+                                                             shape=(self.slots,))
+        return table
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+        # 0 marks an empty slot
+        return struct.unpack('<Q', digest)[0] or 1
+
+    @staticmethod
+    def _check(key_hash, values):
+        return struct.unpack('<Q', hashlib.blake2b(struct.pack('<Q', key_hash) + values.tobytes(),
+                                                   digest_size=8).digest())[0]
+
+    def get(self, version, key):
+        table = self._table(version)
+        key_hash = self._hash(key)
+        record = table[key_hash % self.slots].copy()
+        if record['key'] != key_hash or record['check'] != self._check(key_hash, record['values']):
+            return None
+        return dict(zip(engine.INDICATORS, record['values'].tolist()))
+
+    def put(self, version, key, result):
+        table = self._table(version)
+        key_hash = self._hash(key)
+        values = np.asarray([result[name] for name in engine.INDICATORS], dtype='<f8')
+        record = np.array((key_hash, values, self._check(key_hash, values)), dtype=SHARED_RECORD)
+        table[key_hash % self.slots] = record
@@ -0,0 +1,387 @@
+"""Calibrate the engine coefficients against field measurements.
+
+    python calibrate.py fit survey.csv sonde-2019.parquet ... \\
+        --map waterDepth=depth_m --map chestnutCoverage=cover_pct \\
+        --map nutrientLevel=tp_ugl/7.5 --map season=sample_date \\
+        --map dissolvedOxygen=do_mgl --map waterClarity=secchi_pct \\
+        [--robust 5] [--chunk-rows 100000] [-o coefficients.json]
+
+Files are read in chunks of rows, so memory stays bounded however long the
+history is.  CSV goes through pandas when it is installed and the ``csv``
+module otherwise; Parquet needs ``pyarrow``.  Each mapping names a model input
+or indicator and the column it comes from, optionally scaled with ``*k`` or
+``/k``.  ``season`` may be a column of season names or of dates.  Unmapped
+inputs take the slider defaults.
+
+Every indicator is linear in its own coefficients before clamping, so each
+mapped indicator is fitted by least squares.  The normal equations are
+accumulated chunk by chunk and solved once per pass.  With ``--robust N``,
+N more passes reweight rows with Huber weights (iteratively reweighted least
+squares), which limits the pull of sonde spikes and data-entry errors.  The
+fitted set is written with its model version and is loaded at startup by
+pointing ``TRAPA_COEFFICIENTS`` at it (see engine.py).
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import json
+import operator
+import os
+
+import numpy as np
+
+import dynamics
+import engine
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_CHUNK_ROWS = 100000
+
+# Huber tuning constant: 95% efficiency for normal residuals
+HUBER_K = 1.345
+
+# Bins of the streamed |residual| histogram the robust scale (MAD) is read from
+SCALE_BINS = 4096
+
+# Shrinks coefficients the data cannot identify (e.g. a column that never varies) toward their current values
+PRIOR_WEIGHT = 1e-8
+
+
+def _deficit(ctx, c):
+    if 'dissolvedOxygen' in ctx:
+        oxygen = ctx['dissolvedOxygen']
+    else:
+        oxygen = (c['dissolved_o2_base'] - ctx['chestnutCoverage'] * c['coverage_dissolved_o2']
+                  - (np.asarray(c['season_temp'])[ctx['season']] - c['reference_temp']) * c['temp_dissolved_o2']
+                  + ctx['waterMovement'] * c['movement_dissolved_o2'])
+    return np.maximum(c['low_o2_threshold'] - oxygen, 0)
+
+
+def _dieoff(ctx, c):
+    fall = ctx['season'] == engine.SEASONS.index('fall')
+    return np.where(fall & (ctx['chestnutCoverage'] > c['dieoff_coverage']), ctx['chestnutCoverage'], 0)
+
+
+# indicator: (fitted coefficients, features(ctx, c) -> (columns, offset)), so that
+# indicator = offset + sum(column * coefficient) before clamping
+DESIGNS = {
+    'waterClarity': (
+        ('clarity_base', 'coverage_clarity', 'depth_clarity'),
+        lambda x, c: ([1, -x['chestnutCoverage'], c['reference_depth'] - x['waterDepth']], 0)),
+    'sedimentOxygen': (
+        ('sediment_o2_base', 'coverage_sediment_o2'),
+        lambda x, c: ([1, -x['chestnutCoverage']], 0)),
+    'stratificationRisk': (
+        ('stratification_base', 'coverage_stratification', 'depth_stratification', 'movement_stratification'),
+        lambda x, c: ([1, x['chestnutCoverage'], x['waterDepth'] - c['reference_depth'], -x['waterMovement']], 0)),
+    'dissolvedOxygen': (
+        ('dissolved_o2_base', 'coverage_dissolved_o2', 'temp_dissolved_o2', 'movement_dissolved_o2'),
+        lambda x, c: ([1, -x['chestnutCoverage'],
+                       c['reference_temp'] - np.asarray(c['season_temp'])[x['season']], x['waterMovement']], 0)),
+    'nutrientAvailability': (
+        ('dieoff_nutrient',),
+        lambda x, c: ([_dieoff(x, c)], x['nutrientLevel'])),
+    'decompositionRate': (
+        ('decomposition_base', 'nutrient_decomposition', 'dieoff_decomposition'),
+        lambda x, c: ([np.asarray(c['season_decomposition'])[x['season']],
+                       x['nutrientLevel'] - c['reference_nutrient'], _dieoff(x, c)], 0)),
+    'microbialBiomass': (
+        ('biomass_base', 'nutrient_biomass', 'low_o2_biomass'),
+        lambda x, c: ([1, x['nutrientLevel'] - c['reference_nutrient'], _deficit(x, c)], 0)),
+    'microbialDiversity': (
+        ('diversity_base', 'low_o2_diversity'),
+        lambda x, c: ([1, -_deficit(x, c)], 0)),
+}
+
+
+def parse_mapping(items):
+    """``target=column``, ``target=column*k`` or ``target=column/k`` to ``{target: (column, scale)}``."""
+    mapping = {}
+    for item in items:
+        target, sep, source = item.partition('=')
+        if not sep or not source:
+            raise ValueError(f'mapping must look like target=column: {item}')
+        if target not in engine.INPUTS and target not in engine.INDICATORS:
+            raise ValueError(f'unknown model input or indicator: {target}')
+        scale = 1.0
+        for op in ('*', '/'):
+            column, sep, factor = source.rpartition(op)
+            if sep:
+                try:
+                    scale = float(factor) if op == '*' else 1 / float(factor)
+                except (ValueError, ZeroDivisionError):
+                    raise ValueError(f'bad scale in mapping: {item}')
+                source = column
+                break
+        if target == 'season' and scale != 1.0:
+            raise ValueError('season cannot be scaled')
+        mapping[target] = (source, scale)
+    if not set(mapping) & set(engine.INDICATORS):
+        raise ValueError('map at least one measured indicator')
+    return mapping
+
+
+def _read_csv(path, columns, chunk_rows):
+    if pandas is not None:
+        for frame in pandas.read_csv(path, usecols=columns, chunksize=chunk_rows, dtype=str):
+            yield {name: frame[name].fillna('').to_numpy(dtype=str) for name in columns}
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        missing = set(columns) - set(header)
+        if missing:
+            raise ValueError(f'{path} has no column {sorted(missing)[0]}')
+        pick = operator.itemgetter(*(header.index(name) for name in columns))
+        width = len(header)
+        rows = []
+        for row in reader:
+            if len(row) < width:
+                row += [''] * (width - len(row))
+            rows.append(pick(row) if len(columns) > 1 else (pick(row),))
+            if len(rows) == chunk_rows:
+                yield dict(zip(columns, zip(*rows)))
+                rows = []
+        if rows:
+            yield dict(zip(columns, zip(*rows)))
+
+
+def _read_parquet(path, columns, chunk_rows):
+    if pyarrow is None:
+        raise ValueError('reading Parquet needs the pyarrow package')
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+        yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in columns}
+
+
+def read_chunks(path, columns, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield dicts of column arrays, ``chunk_rows`` rows at a time."""
+    if path.endswith(('.parquet', '.pq')):
+        return _read_parquet(path, columns, chunk_rows)
+    return _read_csv(path, columns, chunk_rows)
+
+
+def _numeric(name, values):
+    if isinstance(values, tuple):
+        # Strings from the csv module: float() is much faster than NumPy's string parsing
+        try:
+            return np.fromiter(map(float, values), float, len(values))
+        except ValueError:
+            values = ['nan' if not value.strip() else value for value in values]
+        try:
+            return np.fromiter(map(float, values), float, len(values))
+        except ValueError:
+            raise ValueError(f'column {name} has non-numeric values')
+    values = np.asarray(values)
+    if values.dtype.kind in 'US':
+        values = np.where(np.char.strip(values) == '', 'nan', values)
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        raise ValueError(f'column {name} has non-numeric values')
+
+
+def _seasons(values):
+    """Season indices from season names or dates; -1 where missing."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        dates = values
+    else:
+        text = np.char.lower(np.char.strip(values.astype(str)))
+        index = np.full(text.shape, -1, dtype=np.intp)
+        for i, name in enumerate(engine.SEASONS):
+            index[text == name] = i
+        if (index >= 0).any() or not (text != '').any():
+            return index
+        try:
+            dates = np.where(text == '', 'NaT', text).astype('datetime64[D]')
+        except ValueError:
+            raise ValueError('season column holds neither season names nor dates')
+    dates = dates.astype('datetime64[D]')
+    day = (dates - dates.astype('datetime64[Y]')).astype(np.int64)
+    return np.where(np.isnat(dates), -1, dynamics.day_season(day))
+
+
+def _context(chunk, mapping):
+    """Model inputs and measured indicators of one chunk, plus a mask of usable rows."""
+    rows = len(next(iter(chunk.values())))
+    ctx = {}
+    valid = np.ones(rows, dtype=bool)
+    for target in engine.INPUTS + engine.INDICATORS:
+        if target not in mapping:
+            if target in engine.INPUTS:
+                default = engine.DEFAULTS[target]
+                ctx[target] = np.full(rows, engine.SEASONS.index(default) if target == 'season' else default)
+            continue
+        column, scale = mapping[target]
+        if target == 'season':
+            ctx[target] = _seasons(chunk[column])
+            valid &= ctx[target] >= 0
+        else:
+            ctx[target] = _numeric(column, chunk[column]) * scale
+            if target in engine.INPUTS:
+                valid &= np.isfinite(ctx[target])
+    ctx['season'] = np.where(valid, ctx['season'], 0)
+    return ctx, valid
+
+
+class NormalEquations:
+    """Running weighted sums for one least-squares fit."""
+
+    def __init__(self, size):
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros(size)
+        self.yty = 0.0
+        self.wy = 0.0
+        self.weight = 0.0
+        self.rows = 0
+
+    def add(self, x, y, w):
+        wx = x * w[:, None]
+        self.xtx += x.T @ wx
+        self.xty += wx.T @ y
+        self.yty += float(w @ (y * y))
+        self.wy += float(w @ y)
+        self.weight += float(w.sum())
+        self.rows += len(y)
+
+    def solve(self, prior):
+        ridge = PRIOR_WEIGHT * max(np.trace(self.xtx) / len(prior), 1.0)
+        a = self.xtx + ridge * np.eye(len(prior))
+        return np.linalg.solve(a, self.xty + ridge * prior)
+
+    def stats(self, beta):
+        rss = max(self.yty - 2 * beta @ self.xty + beta @ self.xtx @ beta, 0.0)
+        tss = self.yty - self.wy * self.wy / self.weight if self.weight else 0.0
+        return {
+            'rows': self.rows,
+            'rmse': (rss / self.weight) ** 0.5 if self.weight else None,
+            'r2': 1 - rss / tss if tss > 0 else None,
+        }
+
+
+def _passes(paths, mapping, chunk_rows, c):
+    """Yield ``(indicator, features, target)`` for every chunk of every file."""
+    columns = sorted({column for column, _ in mapping.values()})
+    for path in paths:
+        for chunk in read_chunks(path, columns, chunk_rows):
+            ctx, valid = _context(chunk, mapping)
+            for name in DESIGNS:
+                if name not in mapping:
+                    continue
+                features, offset = DESIGNS[name][1](ctx, c)
+                x = np.column_stack([np.broadcast_to(f, valid.shape) for f in features]).astype(float)
+                y = ctx[name] - offset
+                rows = valid & np.isfinite(y) & np.isfinite(x).all(axis=1)
+                yield name, x[rows], y[rows]
+
+
+def fit(paths, mapping, robust=0, chunk_rows=DEFAULT_CHUNK_ROWS, coefficients=None):
+    """Fit the coefficients of every mapped indicator.
+
+    Returns ``(coefficients, report)``: the full coefficient set with fitted
+    values substituted, and per-indicator fit statistics.
+    """
+    c = dict(engine.COEFFICIENTS if coefficients is None else coefficients)
+    fitted = [name for name in DESIGNS if name in mapping]
+    prior = {name: np.array([c[key] for key in DESIGNS[name][0]], dtype=float) for name in fitted}
+    beta, scale = dict(prior), {}
+
+    for iteration in range(robust + 1):
+        equations = {name: NormalEquations(len(prior[name])) for name in fitted}
+        histograms = {name: np.zeros(SCALE_BINS) for name in fitted}
+        for name, x, y in _passes(paths, mapping, chunk_rows, c):
+            if iteration == 0:
+                weights = np.ones(len(y))
+            else:
+                residual = np.abs(y - x @ beta[name])
+                top = 10 * scale[name]
+                # Residuals beyond the range count in the last bin so the median stays exact
+                histograms[name] += np.histogram(np.minimum(residual, top), SCALE_BINS, (0, top))[0]
+                weights = np.minimum(1.0, HUBER_K * scale[name] / np.maximum(residual, 1e-300))
+            equations[name].add(x, y, weights)
+
+        converged = True
+        for name in fitted:
+            if not equations[name].rows:
+                raise ValueError(f'no usable rows for {name}')
+            previous = beta[name]
+            beta[name] = equations[name].solve(prior[name])
+            converged &= iteration > 0 and np.allclose(beta[name], previous, rtol=1e-8, atol=1e-12)
+            if iteration == 0:
+                scale[name] = equations[name].stats(beta[name])['rmse'] or 1.0
+            else:
+                # Median absolute residual of the previous fit, rescaled to a normal standard deviation
+                cumulative = np.cumsum(histograms[name])
+                median = (np.searchsorted(cumulative, cumulative[-1] / 2) + 0.5) * 10 * scale[name] / SCALE_BINS
+                scale[name] = max(median / 0.6745, 1e-12)
+        if converged:
+            break
+
+    report = {}
+    for name in fitted:
+        for key, value in zip(DESIGNS[name][0], beta[name]):
+            c[key] = float(value)
+        report[name] = equations[name].stats(beta[name])
+        report[name]['coefficients'] = {key: float(value) for key, value in zip(DESIGNS[name][0], beta[name])}
+    return c, report
+
+
+def save(path, coefficients, report, sources, mapping, robust):
+    """Write a coefficient set with its version and provenance; returns the version."""
+    version = engine.model_version(coefficients)
+    document = {
+        'modelVersion': version,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'sources': [os.path.abspath(source) for source in sources],
+        'mapping': {target: {'column': column, 'scale': scale} for target, (column, scale) in mapping.items()},
+        'robustPasses': robust,
+        'fit': report,
+        'coefficients': {key: list(value) if isinstance(value, tuple) else value
+                         for key, value in coefficients.items()},
+    }
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp, path)
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit the engine coefficients to field data.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('fit')
+    run.add_argument('files', nargs='+', help='CSV (optionally .gz) or Parquet measurement files')
+    run.add_argument('--map', action='append', default=[], metavar='TARGET=COLUMN[*K|/K]',
+                     help='column supplying a model input or measured indicator')
+    run.add_argument('--robust', type=int, default=0, metavar='N', help='Huber reweighting passes')
+    run.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    run.add_argument('-o', '--output', help='default: coefficients-<version>.json')
+    args = parser.parse_args()
+
+    try:
+        mapping = parse_mapping(args.map)
+        coefficients, report = fit(args.files, mapping, args.robust, args.chunk_rows)
+    except ValueError as e:
+        parser.error(str(e))
+    for name, stats in report.items():
+        r2 = 'n/a' if stats['r2'] is None else f'{stats["r2"]:.3f}'
+        print(f'{name}: {stats["rows"]} rows, rmse {stats["rmse"]:.4g}, r2 {r2}')
+        for key, value in stats['coefficients'].items():
+            print(f'    {key:26s} {engine.COEFFICIENTS[key]:>10.4g} -> {value:.4g}')
+    output = args.output or f'coefficients-{engine.model_version(coefficients)}.json'
+    version = save(output, coefficients, report, args.files, mapping, args.robust)
+    print(f'Wrote model {version} to {output}; load it with TRAPA_COEFFICIENTS={output}')
+
+
+if __name__ == '__main__':
+    main()
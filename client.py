@@ -0,0 +1,71 @@
+"""Python client for the backend's batch endpoints.
+
+    client = Client('http://localhost:5000')
+    indicators = client.calculate({'waterDepth': depths, 'chestnutCoverage': coverage})
+    for frame in client.sweep({'season': ['fall']}):
+        ...
+
+Batch results are requested in the columnar binary format and returned as
+dicts of float32 NumPy arrays that view the response body directly.
+"""
+import json
+import urllib.request
+
+import numpy as np
+
+import columnar
+
+
+class Client:
+    """Talks to one backend at ``base_url``."""
+
+    def __init__(self, base_url='http://localhost:5000', timeout=300):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _post(self, path, payload):
+        body = json.dumps(payload, default=_jsonable).encode('utf-8')
+        req = urllib.request.Request(self.base_url + path, body, {
+            'Content-Type': 'application/json',
+            'Accept': columnar.MIMETYPE,
+        })
+        return urllib.request.urlopen(req, timeout=self.timeout)
+
+    def calculate(self, scenarios):
+        """Score a batch (list of scenarios or columnar dict); returns indicator arrays."""
+        with self._post('/api/calculate', scenarios) as response:
+            columns, _ = columnar.decode(response.read())
+        return columns
+
+    def sweep(self, axes=None, chunk_size=None):
+        """Yield one dict of column arrays per streamed chunk of a grid sweep."""
+        payload = {'axes': axes or {}, 'format': 'binary'}
+        if chunk_size is not None:
+            payload['chunkSize'] = chunk_size
+        with self._post('/api/sweep', payload) as response:
+            while True:
+                header = _read_exact(response, columnar.HEADER.size)
+                if not header:
+                    return
+                _, _, count, rows, length = columnar.HEADER.unpack(header)
+                frame = header + _read_exact(response, length - len(header) + count * rows * 4)
+                yield columnar.decode(frame)[0]
+
+
+def _read_exact(stream, size):
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
@@ -0,0 +1,79 @@
+"""Request coalescing for single-scenario calculations.
+
+Handler threads submit one scenario each and block on a future.  A batcher
+thread waits ``window`` seconds after the first submission, then scores
+everything that arrived in one vectorized engine call and hands each caller
+its own row.  Identical scenarios share one future while it is waiting or
+being scored.
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import engine
+import metrics
+
+
+class Coalescer:
+    """Batches scenarios submitted within ``window`` seconds into one ``evaluate`` call."""
+
+    def __init__(self, evaluate, window=0.002, max_batch=8192):
+        self.evaluate = evaluate
+        self.window = window
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {}
+        # Taken from pending and being scored; kept until their futures are resolved
+        self.in_flight = {}
+        thread = threading.Thread(target=self._run, name='coalescer', daemon=True)
+        thread.start()
+
+    def submit(self, scenario):
+        """Queue a scenario tuple in engine.INPUTS order (season as an index)."""
+        with self.lock:
+            future = self.pending.get(scenario) or self.in_flight.get(scenario)
+            metrics.CACHE_LOOKUPS.inc(cache='coalescer', result='miss' if future is None else 'hit')
+            if future is None:
+                future = self.pending[scenario] = Future()
+                self.wakeup.set()
+        return future
+
+    def calculate(self, scenario, timeout=None):
+        return self.submit(scenario).result(timeout)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            # Let concurrent requests pile up before taking the batch
+            time.sleep(self.window)
+            with self.lock:
+                batch = list(self.pending.items())[:self.max_batch]
+                for key, future in batch:
+                    del self.pending[key]
+                    self.in_flight[key] = future
+                if not self.pending:
+                    self.wakeup.clear()
+            if batch:
+                try:
+                    self._flush(batch)
+                finally:
+                    with self.lock:
+                        for key, _ in batch:
+                            del self.in_flight[key]
+
+    def _flush(self, batch):
+        metrics.BATCH_SIZE.observe(len(batch), route='coalescer')
+        columns = list(zip(*(key for key, _ in batch)))
+        inputs = {name: np.asarray(values) for name, values in zip(engine.INPUTS, columns)}
+        try:
+            indicators = self.evaluate(**inputs)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        rows = zip(*(indicators[name].tolist() for name in engine.INDICATORS))
+        for (_, future), row in zip(batch, rows):
+            future.set_result(dict(zip(engine.INDICATORS, row)))
@@ -0,0 +1,65 @@
+// Decoder for the columnar binary format served by the Flask backend
+// (see columnar.py). Columns are returned as Float32Array views over the
+// response buffer, so no per-row objects are created.
+
+const COLUMNAR_MIMETYPE = 'application/vnd.trapa.columns';
+
+function decodeColumnarFrame(buffer, offset = 0) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(
+    view.getUint8(offset), view.getUint8(offset + 1), view.getUint8(offset + 2), view.getUint8(offset + 3)
+  );
+  if (magic !== 'TRPC') {
+    throw new Error('Not a columnar frame');
+  }
+  const version = view.getUint16(offset + 4, true);
+  if (version !== 1) {
+    throw new Error(`Unsupported columnar version ${version}`);
+  }
+  const count = view.getUint16(offset + 6, true);
+  const rows = view.getUint32(offset + 8, true) + view.getUint32(offset + 12, true) * 2 ** 32;
+  const headerLength = view.getUint32(offset + 16, true);
+
+  const decoder = new TextDecoder();
+  const names = [];
+  let pos = offset + 20;
+  for (let i = 0; i < count; i++) {
+    const size = view.getUint8(pos);
+    names.push(decoder.decode(new Uint8Array(buffer, pos + 1, size)));
+    pos += 1 + size;
+  }
+
+  const columns = {};
+  const start = offset + headerLength;
+  names.forEach((name, i) => {
+    columns[name] = new Float32Array(buffer, start + i * rows * 4, rows);
+  });
+  return { rows, columns, end: start + count * rows * 4 };
+}
+
+function decodeColumnarFrames(buffer) {
+  const frames = [];
+  let offset = 0;
+  while (offset < buffer.byteLength) {
+    const frame = decodeColumnarFrame(buffer, offset);
+    frames.push(frame);
+    offset = frame.end;
+  }
+  return frames;
+}
+
+async function fetchColumns(url, body) {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Accept': COLUMNAR_MIMETYPE },
+    body: JSON.stringify(body)
+  });
+  if (!response.ok) {
+    throw new Error(`Request failed: ${response.status}`);
+  }
+  return decodeColumnarFrames(await response.arrayBuffer());
+}
+
+if (typeof module !== 'undefined') {
+  module.exports = { COLUMNAR_MIMETYPE, decodeColumnarFrame, decodeColumnarFrames, fetchColumns };
+}
@@ -0,0 +1,72 @@
+"""Compact columnar binary format for batch results.
+
+A frame is a small header followed by one contiguous little-endian float32
+column per field:
+
+    magic 'TRPC' | version u16 | column count u16 | row count u64 | header length u32
+    per column: name length u8, UTF-8 name
+    zero padding to a multiple of 4 bytes
+    column 0 as float32[rows], column 1, ...
+
+Columns start 4-byte aligned and every frame is a multiple of 4 bytes long,
+so a reader can view each column in place (``numpy.frombuffer``, JS
+``Float32Array``), including in a stream of back-to-back frames.
+"""
+import struct
+
+import numpy as np
+
+MIMETYPE = 'application/vnd.trapa.columns'
+MAGIC = b'TRPC'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQI')
+
+
+def _header(names, rows):
+    encoded = [name.encode('utf-8') for name in names]
+    if any(len(name) > 255 for name in encoded):
+        raise ValueError('column names are limited to 255 bytes')
+    body = b''.join(bytes([len(name)]) + name for name in encoded)
+    length = HEADER.size + len(body)
+    padding = -length % 4
+    length += padding
+    return HEADER.pack(MAGIC, VERSION, len(names), rows, length) + body + b'\0' * padding
+
+
+def encode(columns):
+    """Pack a dict of equal-length arrays into one frame."""
+    names = list(columns)
+    rows = len(columns[names[0]]) if names else 0
+    data = np.empty((len(names), rows), dtype='<f4')
+    for i, name in enumerate(names):
+        data[i] = columns[name]
+    return _header(names, rows) + data.tobytes()
+
+
+def decode(buffer, offset=0):
+    """Read one frame; returns ``(columns, end offset)`` with columns viewing ``buffer``."""
+    magic, version, count, rows, length = HEADER.unpack_from(buffer, offset)
+    if magic != MAGIC:
+        raise ValueError('not a columnar frame')
+    if version != VERSION:
+        raise ValueError(f'unsupported columnar version {version}')
+    pos = offset + HEADER.size
+    names = []
+    for _ in range(count):
+        size = buffer[pos]
+        names.append(bytes(buffer[pos + 1:pos + 1 + size]).decode('utf-8'))
+        pos += 1 + size
+    start = offset + length
+    columns = {
+        name: np.frombuffer(buffer, dtype='<f4', count=rows, offset=start + i * rows * 4)
+        for i, name in enumerate(names)
+    }
+    return columns, start + count * rows * 4
+
+
+def decode_frames(buffer):
+    """Yield every frame of a stream of back-to-back frames."""
+    offset = 0
+    while offset < len(buffer):
+        columns, offset = decode(buffer, offset)
+        yield columns
@@ -0,0 +1,127 @@
+"""The indicator model as a dependency graph, for incremental recomputation.
+
+Each node is one intermediate or indicator of ``engine.calculate_indicators``
+with the nodes or inputs it reads.  A :class:`Session` keeps the current value
+of every node for one client; changing an input recomputes only the nodes
+downstream of it, and stops early where a recomputed value did not change, so
+a depth change never touches nutrient availability and a small coverage
+change below the die-off threshold never touches decomposition.
+"""
+import numpy as np
+
+import engine
+
+FALL = engine.SEASONS.index('fall')
+
+
+def _clamp(name, value):
+    low, high = engine.LIMITS[name]
+    return float(min(max(value, low), high))
+
+
+# name: (dependencies, function of (coefficients, *dependency values)), in topological order
+NODES = {
+    'temp': (('season',), lambda c, s: c['season_temp'][s]),
+    'seasonDecomposition': (('season',), lambda c, s: c['season_decomposition'][s]),
+    # Coverage that decomposes in the fall die-off, 0 outside it
+    'dieoffCoverage': (
+        ('season', 'chestnutCoverage'),
+        lambda c, s, cov: cov if s == FALL and cov > c['dieoff_coverage'] else 0),
+    'dissolvedOxygenRaw': (
+        ('chestnutCoverage', 'temp', 'waterMovement'),
+        lambda c, cov, temp, mov: (c['dissolved_o2_base'] - cov * c['coverage_dissolved_o2']
+                                   - (temp - c['reference_temp']) * c['temp_dissolved_o2']
+                                   + mov * c['movement_dissolved_o2'])),
+    'o2Deficit': (('dissolvedOxygenRaw',), lambda c, do: max(c['low_o2_threshold'] - do, 0)),
+    'waterClarity': (
+        ('chestnutCoverage', 'waterDepth'),
+        lambda c, cov, depth: _clamp('waterClarity', c['clarity_base'] - cov * c['coverage_clarity']
+                                     - (depth - c['reference_depth']) * c['depth_clarity'])),
+    'sedimentOxygen': (
+        ('chestnutCoverage',),
+        lambda c, cov: _clamp('sedimentOxygen', c['sediment_o2_base'] - cov * c['coverage_sediment_o2'])),
+    'stratificationRisk': (
+        ('chestnutCoverage', 'waterDepth', 'waterMovement'),
+        lambda c, cov, depth, mov: _clamp('stratificationRisk', c['stratification_base']
+                                          + cov * c['coverage_stratification']
+                                          + (depth - c['reference_depth']) * c['depth_stratification']
+                                          - mov * c['movement_stratification'])),
+    'dissolvedOxygen': (('dissolvedOxygenRaw',), lambda c, do: _clamp('dissolvedOxygen', do)),
+    'nutrientAvailability': (
+        ('nutrientLevel', 'dieoffCoverage'),
+        lambda c, nut, dieoff: _clamp('nutrientAvailability', nut + dieoff * c['dieoff_nutrient'])),
+    'decompositionRate': (
+        ('seasonDecomposition', 'nutrientLevel', 'dieoffCoverage'),
+        lambda c, sd, nut, dieoff: _clamp('decompositionRate', c['decomposition_base'] * sd
+                                          + (nut - c['reference_nutrient']) * c['nutrient_decomposition']
+                                          + dieoff * c['dieoff_decomposition'])),
+    'microbialBiomass': (
+        ('nutrientLevel', 'o2Deficit'),
+        lambda c, nut, deficit: _clamp('microbialBiomass', c['biomass_base']
+                                       + (nut - c['reference_nutrient']) * c['nutrient_biomass']
+                                       + deficit * c['low_o2_biomass'])),
+    'microbialDiversity': (
+        ('o2Deficit',),
+        lambda c, deficit: _clamp('microbialDiversity', c['diversity_base'] - deficit * c['low_o2_diversity'])),
+}
+
+
+def _scalar(key, value):
+    if key == 'season':
+        index = engine.season_index(value)
+        if np.ndim(index) != 0:
+            raise ValueError('season must be a single value')
+        return int(index)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be numeric')
+    if not np.isfinite(value):
+        raise ValueError(f'{key} must be finite')
+    return value
+
+
+class Session:
+    """Current inputs and node values of one client."""
+
+    def __init__(self, inputs=None, coefficients=None):
+        self.coefficients = coefficients
+        self.values = {}
+        self.version = None
+        self.recomputed = 0
+        self.update({**engine.DEFAULTS, **(inputs or {})})
+
+    @property
+    def indicators(self):
+        return {name: self.values[name] for name in engine.INDICATORS}
+
+    def update(self, changes):
+        """Apply input changes; returns the indicators whose values changed."""
+        unknown = set(changes) - set(engine.INPUTS)
+        if unknown:
+            raise ValueError(f'unknown input: {sorted(unknown)[0]}')
+        changes = {key: _scalar(key, value) for key, value in changes.items()}
+
+        c = engine.COEFFICIENTS if self.coefficients is None else self.coefficients
+        version = engine.model_version(self.coefficients)
+        if version != self.version:
+            # New coefficients invalidate every node
+            self.version = version
+            self.values.update({key: changes.get(key, self.values.get(key)) for key in engine.INPUTS})
+            dirty = set(engine.INPUTS)
+        else:
+            dirty = {key for key, value in changes.items() if self.values[key] != value}
+            self.values.update(changes)
+
+        changed = {}
+        for name, (deps, formula) in NODES.items():
+            if not dirty.intersection(deps):
+                continue
+            value = formula(c, *(self.values[dep] for dep in deps))
+            self.recomputed += 1
+            if self.values.get(name) != value:
+                self.values[name] = value
+                dirty.add(name)
+                if name in engine.LIMITS:
+                    changed[name] = value
+        return changed
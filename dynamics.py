@@ -0,0 +1,135 @@
+"""Day-by-day seasonal dynamics.
+
+The static engine gives the indicator values a lake would settle at for a
+season.  Here the state (dissolved oxygen, nutrients, decomposition,
+microbial biomass and diversity, chestnut coverage) relaxes toward those
+targets one day at a time, and the two threshold rules of the static model
+become state transitions:
+
+* fall die-off: in fall, mats above the die-off coverage collapse into a
+  detritus pool that releases nutrients and drives decomposition until it
+  has broken down; mats regrow in spring and summer;
+* low-oxygen shift: the microbial community flips to an anaerobic state
+  when DO drops below the threshold and only recovers once DO is back above
+  it by ``RECOVERY_MARGIN``.
+
+All scenarios advance together as arrays, a batch of days at a time.
+"""
+import numpy as np
+
+import engine
+
+DAYS_PER_YEAR = 365
+
+# First day of each season (0 = January 1st), in engine.SEASONS order
+SEASON_STARTS = (79, 171, 265, 355)
+
+# Fraction of the gap to the seasonal target closed per day
+RELAXATION = {
+    'dissolvedOxygen': 0.5,
+    'nutrientAvailability': 0.2,
+    'decompositionRate': 0.3,
+    'microbialBiomass': 0.1,
+    'microbialDiversity': 0.05,
+}
+
+DIEOFF_RATE = 0.05      # fraction of the mat dying per fall day
+REGROWTH_RATE = 0.08    # logistic regrowth rate in spring and summer
+DETRITUS_DECAY = 0.02   # detritus broken down per unit of decomposition rate per day
+RECOVERY_MARGIN = 0.5   # mg/L above the low-oxygen threshold needed to recover
+
+STATE = ('chestnutCoverage', 'detritus', 'anaerobic') + tuple(RELAXATION)
+
+
+def day_season(day):
+    """Season index of each day of the year."""
+    day = np.asarray(day) % DAYS_PER_YEAR
+    # Days before the spring start belong to the previous winter
+    return (np.searchsorted(SEASON_STARTS, day, side='right') - 1) % len(engine.SEASONS)
+
+
+def _static_coefficients(coefficients):
+    # The thresholded terms are handled as state transitions instead
+    c = dict(engine.COEFFICIENTS if coefficients is None else coefficients)
+    c.update(dieoff_nutrient=0.0, dieoff_decomposition=0.0, low_o2_diversity=0.0, low_o2_biomass=0.0)
+    return c
+
+
+class Simulation:
+    """Vectorized state for a batch of scenarios, advanced with ``run``."""
+
+    def __init__(self, waterDepth, chestnutCoverage, nutrientLevel, waterMovement,
+                 start_day=0, coefficients=None):
+        self.c = engine.COEFFICIENTS if coefficients is None else coefficients
+        self.static = _static_coefficients(coefficients)
+        self.depth, self.coverage_target, self.nutrient, self.movement = (
+            np.asarray(a, dtype=float) for a in np.broadcast_arrays(
+                waterDepth, chestnutCoverage, nutrientLevel, waterMovement))
+        self.day = start_day
+        season = day_season(start_day)
+        target = self._targets(self.coverage_target, season)
+        self.state = {name: target[name].copy() for name in RELAXATION}
+        self.state['chestnutCoverage'] = self.coverage_target.copy()
+        self.state['detritus'] = np.zeros_like(self.depth)
+        self.state['anaerobic'] = target['dissolvedOxygen'] < self.c['low_o2_threshold']
+
+    def _targets(self, coverage, season):
+        return engine.calculate_indicators(self.depth, coverage, self.nutrient, self.movement,
+                                           np.full(self.depth.shape, season), coefficients=self.static)
+
+    def step(self):
+        """Advance every scenario by one day."""
+        c, s = self.c, self.state
+        season = int(day_season(self.day))
+        name = engine.SEASONS[season]
+
+        # Mat collapse in fall, regrowth in spring and summer
+        coverage = s['chestnutCoverage']
+        if name == 'fall':
+            dying = np.where(coverage > c['dieoff_coverage'], coverage * DIEOFF_RATE, 0.0)
+            coverage = coverage - dying
+            s['detritus'] = s['detritus'] + dying
+        elif name in ('spring', 'summer'):
+            room = np.maximum(self.coverage_target, 1e-9)
+            coverage = coverage + REGROWTH_RATE * np.maximum(coverage, 1.0) * (1 - coverage / room)
+            coverage = np.minimum(coverage, self.coverage_target)
+        s['chestnutCoverage'] = coverage
+
+        target = self._targets(coverage, season)
+        # Detritus feeds nutrients and decomposition until broken down
+        target['nutrientAvailability'] = np.clip(
+            target['nutrientAvailability'] + s['detritus'] * c['dieoff_nutrient'],
+            *engine.LIMITS['nutrientAvailability'])
+        target['decompositionRate'] = np.clip(
+            target['decompositionRate'] + s['detritus'] * c['dieoff_decomposition'],
+            *engine.LIMITS['decompositionRate'])
+
+        # Low-oxygen community shift with hysteresis
+        do = s['dissolvedOxygen']
+        threshold = c['low_o2_threshold']
+        s['anaerobic'] = np.where(s['anaerobic'], do < threshold + RECOVERY_MARGIN, do < threshold)
+        deficit = np.where(s['anaerobic'], np.maximum(threshold - do, 0), 0.0)
+        target['microbialDiversity'] = np.clip(
+            target['microbialDiversity'] - deficit * c['low_o2_diversity'], *engine.LIMITS['microbialDiversity'])
+        target['microbialBiomass'] = np.clip(
+            target['microbialBiomass'] + deficit * c['low_o2_biomass'], *engine.LIMITS['microbialBiomass'])
+
+        for key, rate in RELAXATION.items():
+            s[key] = s[key] + rate * (target[key] - s[key])
+        s['detritus'] = s['detritus'] * (1 - np.minimum(DETRITUS_DECAY * s['decompositionRate'], 1))
+        self.day += 1
+
+    def run(self, days=DAYS_PER_YEAR, batch_days=30):
+        """Yield ``(day numbers, {state name: array of shape (days, n)})`` per batch."""
+        remaining = days
+        while remaining > 0:
+            count = min(batch_days, remaining)
+            first = self.day
+            out = {key: np.empty((count,) + self.depth.shape, dtype=bool if key == 'anaerobic' else float)
+                   for key in STATE}
+            for i in range(count):
+                self.step()
+                for key in STATE:
+                    out[key][i] = self.state[key]
+            remaining -= count
+            yield np.arange(first, first + count), out
@@ -0,0 +1,303 @@
+"""Vectorized ecosystem engine.
+
+A NumPy port of ``TrapaNatansSimulation.calculateEcologicalIndicators`` from
+the inline page in app.py.  Every input is an array, so one call scores any
+number of scenarios without a Python loop.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import metrics
+
+SEASONS = ('spring', 'summer', 'fall', 'winter')
+
+INPUTS = ('waterDepth', 'chestnutCoverage', 'nutrientLevel', 'waterMovement', 'season')
+
+# Slider defaults from the TrapaNatansSimulation constructor
+DEFAULTS = {
+    'waterDepth': 2.0,
+    'chestnutCoverage': 0,
+    'nutrientLevel': 5,
+    'waterMovement': 5,
+    'season': 'summer',
+}
+
+# Output order and clamp range of each indicator
+INDICATORS = (
+    'waterClarity',
+    'sedimentOxygen',
+    'stratificationRisk',
+    'dissolvedOxygen',
+    'nutrientAvailability',
+    'decompositionRate',
+    'microbialBiomass',
+    'microbialDiversity',
+)
+
+LIMITS = {
+    'waterClarity': (0, 100),
+    'sedimentOxygen': (0, 100),
+    'stratificationRisk': (0, 100),
+    'dissolvedOxygen': (0, 15),
+    'nutrientAvailability': (0, 10),
+    'decompositionRate': (0, 10),
+    'microbialBiomass': (0, 100),
+    'microbialDiversity': (0, 100),
+}
+
+# Decimals kept in /api/calculate results, whether scored live or read from the float32 table
+OUTPUT_DECIMALS = 4
+
+# Model coefficients, named after the term they scale.  Seasonal entries are
+# indexed in SEASONS order.
+COEFFICIENTS = {
+    'clarity_base': 80.0,
+    'sediment_o2_base': 70.0,
+    'stratification_base': 20.0,
+    'dissolved_o2_base': 8.5,
+    'decomposition_base': 3.0,
+    'biomass_base': 60.0,
+    'diversity_base': 75.0,
+
+    'coverage_clarity': 0.6,
+    'coverage_dissolved_o2': 0.05,
+    'coverage_sediment_o2': 0.4,
+    'coverage_stratification': 0.3,
+
+    'season_temp': (15.0, 25.0, 15.0, 5.0),
+    'season_light': (70.0, 100.0, 50.0, 30.0),
+    'season_decomposition': (0.8, 1.2, 1.5, 0.5),
+    'reference_temp': 15.0,
+    'temp_dissolved_o2': 0.1,
+
+    'reference_depth': 2.0,
+    'depth_clarity': 5.0,
+    'depth_stratification': 10.0,
+
+    'movement_dissolved_o2': 0.2,
+    'movement_stratification': 5.0,
+
+    'reference_nutrient': 5.0,
+    'nutrient_biomass': 5.0,
+    'nutrient_decomposition': 0.5,
+
+    'dieoff_coverage': 50.0,
+    'dieoff_nutrient': 0.1,
+    'dieoff_decomposition': 0.05,
+
+    'low_o2_threshold': 5.0,
+    'low_o2_diversity': 5.0,
+    'low_o2_biomass': 3.0,
+}
+
+_model_version = None
+
+
+def model_version(coefficients=None):
+    """Short content hash of a coefficient set; changes whenever any value does.
+
+    Without an argument this is the version of the live coefficients, cached
+    until ``set_coefficients`` replaces them.
+    """
+    global _model_version
+    if coefficients is None:
+        if _model_version is None:
+            _model_version = model_version(COEFFICIENTS)
+        return _model_version
+    blob = json.dumps({key: np.asarray(value).tolist() for key, value in coefficients.items()}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+
+def set_coefficients(values):
+    """Update the live coefficients in place; caches keyed on model_version() drop their entries."""
+    global _model_version
+    unknown = set(values) - set(COEFFICIENTS)
+    if unknown:
+        raise ValueError(f'unknown coefficient: {sorted(unknown)[0]}')
+    COEFFICIENTS.update(values)
+    _model_version = None
+
+
+def load_coefficients(path):
+    """Coefficients from a set written by ``calibrate.py``."""
+    with open(path) as f:
+        values = json.load(f)['coefficients']
+    return {key: tuple(value) if isinstance(value, list) else value for key, value in values.items()}
+
+
+def season_index(season):
+    """Map season names (or indices) to integer indices into SEASONS."""
+    arr = np.asarray(season)
+    if arr.dtype.kind in 'iu':
+        if arr.size and (arr.min() < 0 or arr.max() >= len(SEASONS)):
+            raise ValueError('season index out of range')
+        return arr.astype(np.intp)
+    names = np.char.lower(arr.astype(str))
+    index = np.full(names.shape, -1, dtype=np.intp)
+    for i, name in enumerate(SEASONS):
+        index[names == name] = i
+    if (index < 0).any():
+        bad = names[index < 0].flat[0]
+        raise ValueError(f'unknown season: {bad}')
+    return index
+
+
+def _season_lookup(table, season):
+    table = np.asarray(table, dtype=float)
+    if table.ndim == 1:
+        return table[season]
+    # Per-sample seasonal tables of shape (n, 4), e.g. from Monte Carlo draws
+    return np.take_along_axis(table, np.broadcast_to(season, table.shape[:1])[:, None], axis=1)[:, 0]
+
+
+def calculate_indicators(waterDepth, chestnutCoverage, nutrientLevel, waterMovement, season,
+                         coefficients=None, dtype=np.float64):
+    """Compute all eight clamped indicators for arrays of scenarios.
+
+    Inputs broadcast against each other; ``season`` may hold names or
+    indices.  Coefficient values may themselves be arrays, which is how
+    per-sample coefficient draws are evaluated.  Returns a dict of arrays
+    keyed by indicator name.
+    """
+    c = COEFFICIENTS if coefficients is None else coefficients
+    lap = metrics.Laps(metrics.ENGINE_STAGE_SECONDS)
+    depth = np.asarray(waterDepth, dtype=dtype)
+    coverage = np.asarray(chestnutCoverage, dtype=dtype)
+    nutrient = np.asarray(nutrientLevel, dtype=dtype)
+    movement = np.asarray(waterMovement, dtype=dtype)
+    season = season_index(season)
+    depth, coverage, nutrient, movement, season = np.broadcast_arrays(
+        depth, coverage, nutrient, movement, season)
+    lap('inputs')
+
+    # Water chestnut coverage effects
+    clarity = c['clarity_base'] - coverage * c['coverage_clarity']
+    dissolved_o2 = c['dissolved_o2_base'] - coverage * c['coverage_dissolved_o2']
+    sediment_o2 = c['sediment_o2_base'] - coverage * c['coverage_sediment_o2']
+    stratification = c['stratification_base'] + coverage * c['coverage_stratification']
+    lap('coverage')
+
+    # Season effects
+    temp = _season_lookup(c['season_temp'], season)
+    dissolved_o2 = dissolved_o2 - (temp - c['reference_temp']) * c['temp_dissolved_o2']
+    decomposition = c['decomposition_base'] * _season_lookup(c['season_decomposition'], season)
+    lap('season')
+
+    # Water depth effects
+    clarity = clarity - (depth - c['reference_depth']) * c['depth_clarity']
+    stratification = stratification + (depth - c['reference_depth']) * c['depth_stratification']
+    lap('depth')
+
+    # Water movement effects
+    dissolved_o2 = dissolved_o2 + movement * c['movement_dissolved_o2']
+    stratification = stratification - movement * c['movement_stratification']
+    lap('movement')
+
+    # Nutrient effects
+    biomass = c['biomass_base'] + (nutrient - c['reference_nutrient']) * c['nutrient_biomass']
+    decomposition = decomposition + (nutrient - c['reference_nutrient']) * c['nutrient_decomposition']
+    lap('nutrient')
+
+    # Fall die-off effect
+    dieoff = (season == SEASONS.index('fall')) & (coverage > c['dieoff_coverage'])
+    nutrient_avail = nutrient + np.where(dieoff, coverage * c['dieoff_nutrient'], 0)
+    decomposition = decomposition + np.where(dieoff, coverage * c['dieoff_decomposition'], 0)
+    lap('dieoff')
+
+    # Microbial community shifts
+    o2_deficit = np.maximum(c['low_o2_threshold'] - dissolved_o2, 0)
+    diversity = c['diversity_base'] - o2_deficit * c['low_o2_diversity']
+    biomass = biomass + o2_deficit * c['low_o2_biomass']
+    lap('microbial')
+
+    raw = {
+        'waterClarity': clarity,
+        'sedimentOxygen': sediment_o2,
+        'stratificationRisk': stratification,
+        'dissolvedOxygen': dissolved_o2,
+        'nutrientAvailability': nutrient_avail,
+        'decompositionRate': decomposition,
+        'microbialBiomass': biomass,
+        'microbialDiversity': diversity,
+    }
+    result = {
+        name: np.clip(np.broadcast_to(raw[name], depth.shape), *LIMITS[name]).astype(dtype, copy=False)
+        for name in INDICATORS
+    }
+    lap('clamp')
+    metrics.ENGINE_CALLS.inc()
+    metrics.ENGINE_SCENARIOS.inc(depth.size)
+    return result
+
+
+def parse_scenarios(data):
+    """Turn a request payload into input arrays.
+
+    Accepts a single scenario object, a list of scenario objects, an object
+    with a ``scenarios`` list, or a columnar object whose input keys map to
+    equal-length lists.  Missing inputs take the slider defaults.  Returns
+    ``(inputs, single)`` where ``single`` is true for a lone scenario.
+    """
+    if isinstance(data, dict) and 'scenarios' in data:
+        data = data['scenarios']
+    if data is None:
+        data = {}
+
+    if isinstance(data, dict):
+        columnar = any(isinstance(data.get(key), (list, tuple)) for key in INPUTS)
+        if not columnar:
+            return {key: np.asarray([data.get(key, DEFAULTS[key])]) for key in INPUTS}, True
+        n = max(len(data[key]) for key in INPUTS if isinstance(data.get(key), (list, tuple)))
+        inputs = {}
+        for key in INPUTS:
+            value = data.get(key, DEFAULTS[key])
+            if isinstance(value, (list, tuple)) and len(value) != n:
+                raise ValueError(f'{key} has {len(value)} values, expected {n}')
+            inputs[key] = np.asarray(value) if isinstance(value, (list, tuple)) else np.full(n, value)
+        return inputs, False
+
+    if isinstance(data, list):
+        inputs = {}
+        for key in INPUTS:
+            default = DEFAULTS[key]
+            if not all(isinstance(row, dict) for row in data):
+                raise ValueError('each scenario must be an object')
+            inputs[key] = np.asarray([row.get(key, default) for row in data])
+        return inputs, False
+
+    raise ValueError('expected a scenario object or a list of scenarios')
+
+
+def validate_inputs(inputs, ndim=1):
+    """Convert parsed inputs to numeric arrays, raising ValueError on bad data.
+
+    Each input may have up to ``ndim`` dimensions (lists of scenarios are
+    1-D) and all of them must broadcast to one shape.
+    """
+    out = {}
+    for key in INPUTS[:-1]:
+        try:
+            out[key] = np.asarray(inputs[key], dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError(f'{key} must be numeric')
+        if not np.isfinite(out[key]).all():
+            raise ValueError(f'{key} must be finite')
+    out['season'] = season_index(inputs['season'])
+    for key, value in out.items():
+        if value.ndim > ndim:
+            raise ValueError(f'{key} must be a single value or a flat list' if ndim == 1
+                             else f'{key} has more than {ndim} dimensions')
+    try:
+        np.broadcast_shapes(*(value.shape for value in out.values()))
+    except ValueError:
+        raise ValueError('inputs differ in shape')
+    return out
+
+
+# A calibrated coefficient set replaces the defaults in every process that imports the engine,
+# including Monte Carlo and sensitivity workers
+if os.environ.get('TRAPA_COEFFICIENTS'):
+    set_coefficients(load_coefficients(os.environ['TRAPA_COEFFICIENTS']))
@@ -0,0 +1,164 @@
+"""Spatial lake model on a raster grid.
+
+Each cell gets its own coverage and depth and is scored with the engine
+formulas.  Dissolved oxygen and nutrients then mix laterally with an explicit
+five-point diffusion stencil, with strength set by ``waterMovement``, and the
+low-oxygen microbial shift is applied to the mixed oxygen.
+
+Large rasters are processed in square tiles.  Each tile is read with a halo
+as wide as the number of mixing steps, since diffusion moves information one
+cell per step, so tiled results match an untiled run exactly while memory
+stays bounded by the tile size.  Inputs and outputs may be memory-mapped
+``.npy`` files.
+
+    python lakegrid.py coverage.npy depth.npy out_dir [--nutrient 5] [--movement 5]
+                       [--season summer] [--steps 10] [--tile 1024]
+"""
+import argparse
+import os
+
+import numpy as np
+
+import engine
+
+# Diffusion number per unit of waterMovement; the explicit stencil is stable up to 0.25
+MIXING_PER_MOVEMENT = 0.02
+MAX_MIXING = 0.24
+
+DEFAULT_STEPS = 10
+DEFAULT_TILE = 1024
+
+MIXED = ('dissolvedOxygen', 'nutrientAvailability')
+
+
+def mixing_rate(waterMovement):
+    return min(MAX_MIXING, MIXING_PER_MOVEMENT * float(waterMovement))
+
+
+def diffuse(field, rate, steps):
+    """Apply ``steps`` explicit diffusion steps with no-flux edges."""
+    u = np.pad(np.asarray(field, dtype=np.float64), 1, mode='edge')
+    core = u[1:-1, 1:-1]
+    for _ in range(steps):
+        core += rate * (u[:-2, 1:-1] + u[2:, 1:-1] + u[1:-1, :-2] + u[1:-1, 2:] - 4 * core)
+        u[0, :], u[-1, :] = u[1, :], u[-2, :]
+        u[:, 0], u[:, -1] = u[:, 1], u[:, -2]
+    return core
+
+
+def _shift_free_coefficients():
+    c = dict(engine.COEFFICIENTS)
+    c.update(low_o2_diversity=0.0, low_o2_biomass=0.0)
+    return c
+
+
+def score_block(coverage, depth, nutrientLevel, waterMovement, season, steps):
+    """Indicators of one block of cells, with mixing applied."""
+    season = engine.season_index(season)
+    indicators = engine.calculate_indicators(depth, coverage, nutrientLevel, waterMovement, season,
+                                             coefficients=_shift_free_coefficients())
+    rate = mixing_rate(waterMovement)
+    for name in MIXED:
+        indicators[name] = diffuse(indicators[name], rate, steps)
+
+    c = engine.COEFFICIENTS
+    deficit = np.maximum(c['low_o2_threshold'] - indicators['dissolvedOxygen'], 0)
+    indicators['microbialDiversity'] = np.clip(indicators['microbialDiversity'] - deficit * c['low_o2_diversity'],
+                                               *engine.LIMITS['microbialDiversity'])
+    indicators['microbialBiomass'] = np.clip(indicators['microbialBiomass'] + deficit * c['low_o2_biomass'],
+                                             *engine.LIMITS['microbialBiomass'])
+    return indicators
+
+
+def run(coverage, depth, nutrientLevel=5, waterMovement=5, season='summer', steps=DEFAULT_STEPS,
+        tile=DEFAULT_TILE, out=None):
+    """Score a lake raster tile by tile.
+
+    ``coverage`` and ``depth`` are 2-D arrays (or scalars, broadcast to the
+    other's shape).  ``out`` may map indicator names to preallocated arrays,
+    for example memory-mapped files; otherwise float32 arrays are allocated.
+    """
+    coverage, depth = np.asarray(coverage), np.asarray(depth)
+    shape = np.broadcast_shapes(coverage.shape, depth.shape)
+    if len(shape) != 2:
+        raise ValueError('coverage and depth must be 2-D rasters')
+    if steps < 0 or tile < 1:
+        raise ValueError('steps must be non-negative and tile positive')
+    coverage = np.broadcast_to(coverage, shape)
+    depth = np.broadcast_to(depth, shape)
+    if out is None:
+        out = {name: np.empty(shape, dtype=np.float32) for name in engine.INDICATORS}
+
+    height, width = shape
+    halo = steps
+    for top in range(0, height, tile):
+        for left in range(0, width, tile):
+            bottom, right = min(top + tile, height), min(left + tile, width)
+            r0, r1 = max(top - halo, 0), min(bottom + halo, height)
+            c0, c1 = max(left - halo, 0), min(right + halo, width)
+            block = score_block(coverage[r0:r1, c0:c1], depth[r0:r1, c0:c1],
+                                nutrientLevel, waterMovement, season, steps)
+            for name in engine.INDICATORS:
+                out[name][top:bottom, left:right] = block[name][top - r0:bottom - r0, left - c0:right - c0]
+    return out
+
+
+def parse_lake(data):
+    """Validate a lake payload; returns keyword arguments for :func:`run`.
+
+    ``chestnutCoverage`` and ``waterDepth`` are rasters (nested lists or
+    arrays) or scalars; the other inputs are scalars shared by every cell.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('expected a lake object')
+    inputs = engine.validate_inputs({key: data.get(key, engine.DEFAULTS[key]) for key in engine.INPUTS},
+                                    ndim=2)
+    for key in ('nutrientLevel', 'waterMovement', 'season'):
+        if np.ndim(inputs[key]) != 0:
+            raise ValueError(f'{key} must be a single value')
+    coverage, depth = inputs['chestnutCoverage'], inputs['waterDepth']
+    if len(np.broadcast_shapes(coverage.shape, depth.shape)) != 2:
+        raise ValueError('chestnutCoverage and waterDepth must be 2-D rasters or scalars')
+    try:
+        steps = int(data.get('steps', DEFAULT_STEPS))
+    except (TypeError, ValueError):
+        raise ValueError('steps must be an integer')
+    return {
+        'coverage': coverage,
+        'depth': depth,
+        'nutrientLevel': float(inputs['nutrientLevel']),
+        'waterMovement': float(inputs['waterMovement']),
+        'season': int(inputs['season']),
+        'steps': steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a lake raster with lateral mixing.')
+    parser.add_argument('coverage', help='.npy raster of chestnut coverage (%%)')
+    parser.add_argument('depth', help='.npy raster of water depth (m)')
+    parser.add_argument('output', help='directory for one .npy raster per indicator')
+    parser.add_argument('--nutrient', type=float, default=5)
+    parser.add_argument('--movement', type=float, default=5)
+    parser.add_argument('--season', default='summer', choices=engine.SEASONS)
+    parser.add_argument('--steps', type=int, default=DEFAULT_STEPS)
+    parser.add_argument('--tile', type=int, default=DEFAULT_TILE)
+    args = parser.parse_args()
+
+    coverage = np.load(args.coverage, mmap_mode='r')
+    depth = np.load(args.depth, mmap_mode='r')
+    shape = np.broadcast_shapes(coverage.shape, depth.shape)
+    os.makedirs(args.output, exist_ok=True)
+    out = {
+        name: np.lib.format.open_memmap(os.path.join(args.output, f'{name}.npy'), mode='w+',
+                                        dtype=np.float32, shape=shape)
+        for name in engine.INDICATORS
+    }
+    run(coverage, depth, args.nutrient, args.movement, args.season, args.steps, args.tile, out)
+    for raster in out.values():
+        raster.flush()
+    print(f'Wrote {len(out)} rasters of shape {shape} to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Prometheus-format metrics with per-thread shards.
+
+Each thread writes only to its own shard, so recording a value takes no
+lock once the thread has one; creating it takes the registry lock, once per
+thread (once per request under thread-per-request servers).  Shards are
+summed when ``/metrics`` is scraped; shards of threads that have exited are
+folded into a retired total so totals never go backwards.
+"""
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BATCH_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Fold dead threads' shards once this many are registered
+MAX_SHARDS = 256
+
+
+class Registry:
+    """Metric definitions plus the per-thread shards holding their values."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+        self.retired = {}
+
+    def shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            with self.lock:
+                if len(self.shards) >= MAX_SHARDS:
+                    self._fold()
+                self.shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _fold(self):
+        live = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _add(self.retired, shard)
+        self.shards = live
+
+    def collect(self):
+        with self.lock:
+            self._fold()
+            total = {}
+            _add(total, self.retired)
+            for _, shard in self.shards:
+                _add(total, dict(shard))
+        return total
+
+    def render(self):
+        """Current values in the Prometheus text exposition format."""
+        values = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for (name, labels), value in sorted(values.items()):
+                if name == metric.name:
+                    lines.extend(metric.render(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _add(total, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            current = total.get(key)
+            total[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def _labels(labels, extra=()):
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, registry=None):
+        self.name, self.help = name, help
+        self.registry = registry or REGISTRY
+        self.registry.metrics[name] = self
+
+    def inc(self, value=1, **labels):
+        shard = self.registry.shard()
+        key = (self.name, tuple(sorted(labels.items())))
+        shard[key] = shard.get(key, 0) + value
+
+    def render(self, labels, value):
+        return [f'{self.name}{_labels(labels)} {value:g}']
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets, registry=None):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        self.bounds = tuple(f'{bound:g}' for bound in self.buckets) + ('+Inf',)
+        self.registry = registry or REGISTRY
+        self.registry.metrics[name] = self
+
+    def observe(self, value, **labels):
+        shard = self.registry.shard()
+        key = (self.name, tuple(sorted(labels.items())))
+        counts = shard.get(key)
+        if counts is None:
+            # One slot per bucket, then +Inf, sum and count
+            counts = shard[key] = [0] * (len(self.buckets) + 3)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def render(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{_labels(labels, (("le", bound),))} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(labels)} {counts[-2]:g}')
+        lines.append(f'{self.name}_count{_labels(labels)} {counts[-1]}')
+        return lines
+
+
+class Laps:
+    """Charges the time since the previous lap to a stage counter."""
+
+    __slots__ = ('counter', 'last')
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.last = time.perf_counter()
+
+    def __call__(self, stage):
+        now = time.perf_counter()
+        self.counter.inc(now - self.last, stage=stage)
+        self.last = now
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = Histogram('trapa_request_duration_seconds', 'Request latency by route.', LATENCY_BUCKETS)
+REQUESTS = Counter('trapa_requests_total', 'Requests by route and status code.')
+BATCH_SIZE = Histogram('trapa_batch_size', 'Scenarios per calculation request.', BATCH_BUCKETS)
+CACHE_LOOKUPS = Counter('trapa_cache_lookups_total', 'Cache lookups by cache and result.')
+ENGINE_CALLS = Counter('trapa_engine_calls_total', 'Vectorized engine calls.')
+ENGINE_SCENARIOS = Counter('trapa_engine_scenarios_total', 'Scenarios scored by the engine.')
+ENGINE_STAGE_SECONDS = Counter('trapa_engine_stage_seconds_total', 'Engine time by model stage.')
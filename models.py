@@ -0,0 +1,192 @@
+"""Registry of the indicator model variants.
+
+The project has grown several versions of the indicator math: the backend
+engine (a port of the inline page's ``calculateEcologicalIndicators``) and
+the static, fallback and seasonal calculations in simulation.js.  Each is
+registered here as a vectorized kernel.  Kernels share one preprocessing
+step per chunk (season masks and factors, unit conversions), and a batch is
+scored by every requested model chunk by chunk, so all models read the same
+inputs while they are still in cache.
+"""
+import numpy as np
+
+import engine
+
+CHUNK_SIZE = 65536
+
+# Microbe proportions reported by the simulation.js variants on top of the engine indicators
+PROPORTIONS = ('aerobicMicrobes', 'anaerobicMicrobes')
+
+# simulation.js calculateEcosystemResponseFallback, in engine.SEASONS order
+FALLBACK_SEASON_FACTORS = {
+    'temp': (0.6, 1.0, 0.7, 0.3),
+    'decomposition': (0.4, 0.8, 1.0, 0.2),
+}
+
+MODELS = {}
+
+
+class Model:
+    """A registered kernel, the indicators it reports and the models it builds on."""
+
+    def __init__(self, name, kernel, indicators, requires=()):
+        self.name = name
+        self.kernel = kernel
+        self.indicators = indicators
+        self.requires = requires
+
+
+def register(name, indicators=engine.INDICATORS + PROPORTIONS, requires=()):
+    """Decorator adding ``kernel(ctx, deps)`` to the registry under ``name``.
+
+    ``deps`` maps each name in ``requires`` to that model's results for the
+    same chunk, so derived models reuse rather than recompute them.
+    """
+    def decorator(kernel):
+        MODELS[name] = Model(name, kernel, tuple(indicators), tuple(requires))
+        return kernel
+    return decorator
+
+
+def prepare(inputs):
+    """Preprocessing shared by every kernel for one chunk of validated inputs."""
+    season = np.asarray(inputs['season'])
+    coverage = np.asarray(inputs['chestnutCoverage'], dtype=np.float64)
+    nutrient = np.asarray(inputs['nutrientLevel'], dtype=np.float64)
+    movement = np.asarray(inputs['waterMovement'], dtype=np.float64)
+    ctx = {
+        'inputs': inputs,
+        'depth': np.asarray(inputs['waterDepth'], dtype=np.float64),
+        'coverage': coverage,
+        'cover': coverage / 100,
+        'nutrient': nutrient,
+        'movement': movement,
+        'season': season,
+        'totalPhosphorus': nutrient * 7.5,  # 1-10 slider to 7.5-75 µg/L
+    }
+    for i, name in enumerate(engine.SEASONS):
+        ctx[name] = season == i
+    for factor, table in FALLBACK_SEASON_FACTORS.items():
+        ctx[f'fallback_{factor}'] = np.asarray(table)[season]
+    return ctx
+
+
+def _round(values):
+    # JavaScript Math.round: halves round up
+    return np.floor(values + 0.5)
+
+
+@register('inline', indicators=engine.INDICATORS)
+def inline(ctx, deps):
+    return engine.calculate_indicators(**ctx['inputs'])
+
+
+@register('static')
+def static(ctx, deps):
+    depth, coverage, tp = ctx['depth'], ctx['coverage'], ctx['totalPhosphorus']
+    aerobic = np.maximum(20, 80 - coverage * 0.5 - depth * 3)
+    return {
+        'waterClarity': np.maximum(20, 100 - coverage * 0.8 - depth * 5),
+        'sedimentOxygen': np.maximum(2, 8 - coverage * 0.05 - depth * 0.3),
+        'stratificationRisk': np.minimum(100, depth * 8 + ctx['movement'] * 2),
+        'dissolvedOxygen': np.maximum(3, 12 - coverage * 0.08 - depth * 0.5),
+        'nutrientAvailability': tp,
+        'decompositionRate': np.select([ctx['fall'], ctx['winter'], ctx['spring']], [8.0, 2.0, 5.0], 6.0),
+        'microbialBiomass': np.minimum(1000, 200 + tp * 8 + np.where(ctx['summer'], 200, 0)),
+        'microbialDiversity': np.maximum(0.2, 1.0 - coverage * 0.008 - depth * 0.05),
+        'aerobicMicrobes': aerobic,
+        # The page subtracts the previous render's aerobic share; the intended value is the complement
+        'anaerobicMicrobes': 100 - aerobic,
+    }
+
+
+@register('fallback')
+def fallback(ctx, deps):
+    depth, coverage, movement = ctx['depth'], ctx['coverage'], ctx['movement']
+    temp = ctx['fallback_temp']
+    dieoff = np.select([ctx['fall'], ctx['winter']], [1.5, 1.2], 1.0)
+    nutrients = ctx['nutrient'] * dieoff + coverage * 0.02
+    oxygen = np.maximum(0, 10 - coverage * 0.06 - temp * 2 + movement * 0.3)
+    stress = np.abs(oxygen - 5) / 5
+    aerobic = np.clip(oxygen / 10 * 80 + movement * 5, 10, 90)
+    return {
+        'waterClarity': np.maximum(10, 100 - coverage * 0.8 - depth * 2),
+        'sedimentOxygen': np.maximum(0, 8 - coverage * 0.05 - depth * 0.3 + movement * 0.2),
+        'stratificationRisk': np.minimum(100, depth * 8 + coverage * 0.3 + temp * 20),
+        'dissolvedOxygen': oxygen,
+        'nutrientAvailability': nutrients,
+        'decompositionRate': ctx['fallback_decomposition'] * 4 + coverage * 0.03,
+        'microbialBiomass': 200 + nutrients * 50 + temp * 100,
+        'microbialDiversity': np.maximum(0.2, 1.0 - stress * 0.3 - coverage * 0.003),
+        'aerobicMicrobes': aerobic,
+        'anaerobicMicrobes': 100 - aerobic,
+    }
+
+
+@register('seasonal', requires=('static',))
+def seasonal(ctx, deps):
+    """updateSeasonalEcosystemMetrics: seasonal multipliers on top of the static model."""
+    base = deps['static']
+    cover = ctx['cover']
+    masks = [ctx[name] for name in engine.SEASONS]
+
+    def per_season(spring, summer, fall, winter):
+        return np.select(masks, [spring, summer, fall, winter], 1.0)
+
+    oxygen = per_season(1 + cover * 0.1, 1 - cover * 0.3, 1 - cover * 0.15, 1.2)
+    multipliers = {
+        'dissolvedOxygen': oxygen,
+        'nutrientAvailability': per_season(1 - cover * 0.1, 1 - cover * 0.3, 1 + cover * 0.2, 1 + cover * 0.3),
+        'decompositionRate': per_season(1.0, 0.8, 1.3, 1.2),
+        'microbialBiomass': per_season(1.2, 0.9, 1.1, 0.8),
+        'waterClarity': per_season(1 - cover * 0.2, 1 - cover * 0.5, 1 - cover * 0.3, 1.1),
+        'stratificationRisk': per_season(1.0, 1.2, 1.1, 0.9),
+        'aerobicMicrobes': oxygen,
+    }
+    result = dict(base)
+    for name, multiplier in multipliers.items():
+        result[name] = _round(base[name] * multiplier)
+    result['anaerobicMicrobes'] = 100 - result['aerobicMicrobes']
+    return result
+
+
+def resolve(names):
+    """Requested model names plus their dependencies, dependencies first."""
+    order = []
+
+    def visit(name):
+        if name not in MODELS:
+            raise ValueError(f'unknown model: {name}')
+        for dep in MODELS[name].requires:
+            visit(dep)
+        if name not in order:
+            order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+
+def evaluate(inputs, names, chunk_size=CHUNK_SIZE, dtype=np.float64):
+    """Score validated inputs with each named model.
+
+    Returns ``{model: {indicator: array}}``.  Every model sees a chunk
+    before the next chunk is prepared.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        raise ValueError('no models requested')
+    order = resolve(names)
+    n = len(np.asarray(inputs['season']))
+    out = {name: {key: np.empty(n, dtype=dtype) for key in MODELS[name].indicators} for name in names}
+    for start in range(0, n, chunk_size):
+        chunk = slice(start, min(start + chunk_size, n))
+        ctx = prepare({key: np.asarray(values)[chunk] for key, values in inputs.items()})
+        results = {}
+        for name in order:
+            model = MODELS[name]
+            results[name] = model.kernel(ctx, {dep: results[dep] for dep in model.requires})
+            if name in out:
+                for key, values in out[name].items():
+                    values[chunk] = results[name][key]
+    return out
@@ -0,0 +1,169 @@
+"""Monte Carlo uncertainty propagation through the engine.
+
+Coefficients and inputs can be given as distributions.  Draws are split into
+fixed-size chunks, each with its own child of one ``SeedSequence``, so a run
+is reproducible whatever the number of workers.  Chunks only send back
+histograms and moments, which merge exactly, and percentiles are read off
+the merged fine histogram.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import engine
+
+CHUNK_SIZE = 250000
+MAX_SAMPLES = 10 ** 8
+
+# Bins per indicator of the histogram percentiles are taken from
+FINE_BINS = 8192
+
+DEFAULT_PERCENTILES = (2.5, 5, 25, 50, 75, 95, 97.5)
+DEFAULT_BINS = 20
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=int(os.environ.get('TRAPA_MC_WORKERS', os.cpu_count() or 1)))
+    return _executor
+
+
+def sample(spec, size, rng, shape=()):
+    """Draw ``size`` values (each of ``shape``) from a distribution spec.
+
+    A spec is a plain number (fixed), or an object with ``dist`` one of
+    ``normal`` (mean, sd), ``uniform`` (low, high), ``triangular`` (low, mode,
+    high), ``lognormal`` (mean, sigma of the underlying normal) or ``choice``
+    (values, optional p).
+    """
+    full = (size,) + shape
+    if not isinstance(spec, dict):
+        return np.broadcast_to(np.asarray(spec, dtype=float), full)
+    dist = spec.get('dist')
+    try:
+        if dist == 'normal':
+            return rng.normal(spec['mean'], spec['sd'], full)
+        if dist == 'uniform':
+            return rng.uniform(spec['low'], spec['high'], full)
+        if dist == 'triangular':
+            return rng.triangular(spec['low'], spec['mode'], spec['high'], full)
+        if dist == 'lognormal':
+            return rng.lognormal(spec['mean'], spec['sigma'], full)
+        if dist == 'choice':
+            return rng.choice(np.asarray(spec['values']), size=full, p=spec.get('p'))
+    except KeyError as e:
+        raise ValueError(f'{dist} distribution needs {e.args[0]}')
+    raise ValueError(f'unknown distribution: {dist}')
+
+
+def _check(scenario, distributions):
+    if not isinstance(distributions, dict):
+        raise ValueError('distributions must be an object')
+    unknown = set(distributions) - set(engine.COEFFICIENTS) - set(engine.INPUTS)
+    if unknown:
+        raise ValueError(f'unknown coefficient or input: {sorted(unknown)[0]}')
+    # Draw a couple of values up front so bad specs fail before work is queued
+    _run_chunk(np.random.SeedSequence(0), 2, scenario, distributions, DEFAULT_BINS)
+
+
+def _run_chunk(seed, size, scenario, distributions, bins):
+    rng = np.random.default_rng(seed)
+    coefficients = dict(engine.COEFFICIENTS)
+    for key, spec in distributions.items():
+        if key in engine.COEFFICIENTS:
+            coefficients[key] = sample(spec, size, rng, np.shape(engine.COEFFICIENTS[key]))
+    inputs = {}
+    for key in engine.INPUTS:
+        spec = distributions.get(key, scenario.get(key, engine.DEFAULTS[key]))
+        if key == 'season':
+            inputs[key] = engine.season_index(sample(spec, size, rng) if isinstance(spec, dict)
+                                              else np.full(size, spec))
+        else:
+            inputs[key] = sample(spec, size, rng)
+    indicators = engine.calculate_indicators(**inputs, coefficients=coefficients)
+
+    out = {}
+    for name, values in indicators.items():
+        low, high = engine.LIMITS[name]
+        out[name] = {
+            'fine': np.histogram(values, FINE_BINS, (low, high))[0],
+            'coarse': np.histogram(values, bins, (low, high))[0],
+            'sum': float(values.sum()),
+            'sumsq': float(np.square(values).sum()),
+            'min': float(values.min()),
+            'max': float(values.max()),
+        }
+    return out
+
+
+def _merge(parts):
+    merged = parts[0]
+    for part in parts[1:]:
+        for name, stats in part.items():
+            m = merged[name]
+            m['fine'] = m['fine'] + stats['fine']
+            m['coarse'] = m['coarse'] + stats['coarse']
+            m['sum'] += stats['sum']
+            m['sumsq'] += stats['sumsq']
+            m['min'] = min(m['min'], stats['min'])
+            m['max'] = max(m['max'], stats['max'])
+    return merged
+
+
+def _percentiles(fine, low, high, lo_seen, hi_seen, percentiles):
+    edges = np.linspace(low, high, len(fine) + 1)
+    cumulative = np.concatenate(([0], np.cumsum(fine))) / fine.sum()
+    q = np.asarray(percentiles) / 100
+    # Linear interpolation inside the first bin whose CDF reaches q, which is
+    # never an empty one, so gaps between occupied bins are not bridged
+    i = np.clip(np.searchsorted(cumulative, q), 1, len(fine))
+    width = cumulative[i] - cumulative[i - 1]
+    fraction = np.clip((q - cumulative[i - 1]) / np.where(width > 0, width, 1), 0, 1)
+    values = edges[i - 1] + fraction * (edges[i] - edges[i - 1])
+    return np.clip(values, lo_seen, hi_seen)
+
+
+def run(scenario, distributions, samples, seed=None, percentiles=DEFAULT_PERCENTILES,
+        bins=DEFAULT_BINS, parallel=True):
+    """Propagate ``samples`` draws and summarize each indicator."""
+    if not 0 < samples <= MAX_SAMPLES:
+        raise ValueError(f'samples must be between 1 and {MAX_SAMPLES}')
+    if not 0 < bins <= 1000:
+        raise ValueError('bins must be between 1 and 1000')
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError('percentiles must be between 0 and 100')
+    _check(scenario, distributions)
+
+    root = np.random.SeedSequence(seed)
+    sizes = [min(CHUNK_SIZE, samples - start) for start in range(0, samples, CHUNK_SIZE)]
+    seeds = root.spawn(len(sizes))
+    args = [(s, n, scenario, distributions, bins) for s, n in zip(seeds, sizes)]
+    if parallel and len(sizes) > 1:
+        parts = list(get_executor().map(_run_chunk, *zip(*args)))
+    else:
+        parts = [_run_chunk(*a) for a in args]
+    merged = _merge(parts)
+
+    result = {}
+    for name, stats in merged.items():
+        low, high = engine.LIMITS[name]
+        mean = stats['sum'] / samples
+        variance = max(stats['sumsq'] / samples - mean * mean, 0.0)
+        values = _percentiles(stats['fine'], low, high, stats['min'], stats['max'], percentiles)
+        result[name] = {
+            'mean': mean,
+            'std': variance ** 0.5,
+            'min': stats['min'],
+            'max': stats['max'],
+            'percentiles': {f'{p:g}': float(v) for p, v in zip(percentiles, values)},
+            'histogram': {
+                'edges': np.linspace(low, high, bins + 1).tolist(),
+                'counts': stats['coarse'].tolist(),
+            },
+        }
+    # The seed is returned as a string: it can exceed what JSON numbers hold exactly
+    return {'samples': samples, 'seed': str(root.entropy), 'indicators': result}
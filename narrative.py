@@ -0,0 +1,158 @@
+"""Explanation text for scenarios, from pre-rendered threshold buckets.
+
+The inline page's ``updateEducationalText`` picks its paragraphs with a few
+thresholds: the coverage band (above 70, above 30, otherwise), the fall
+die-off (fall with coverage above 50), low oxygen (DO below 5) and high
+stratification risk (above 60).  Those give 24 buckets.  Every bucket's text
+is rendered once into a template with slots for the numbers, so a batch only
+classifies scenarios, formats the numbers and fills the slots.
+
+Numbers are formatted like JavaScript's ``toFixed`` and ``String(number)``,
+so the text matches what the page shows.  Formatted indicator values come
+from per-field lookup tables, since clamped indicators only take a bounded
+set of rounded values.
+"""
+import fractions
+import re
+
+import numpy as np
+
+import engine
+
+COVERAGE_BANDS = ('low', 'moderate', 'high')
+BUCKETS = len(COVERAGE_BANDS) * 8
+
+# Paragraphs of updateEducationalText; {field:digits} marks a number formatted with toFixed(digits),
+# and {chestnutCoverage} the coverage as the page prints it
+COVERAGE_TEXT = {
+    'high': (
+        ('font-semibold', 'High Water Chestnut Coverage ({chestnutCoverage}%)'),
+        (None, 'The dense floating mat severely limits light penetration and gas exchange. Dissolved oxygen '
+               'has dropped to {dissolvedOxygen:1} mg/L, creating stressful conditions for many aquatic '
+               'organisms.'),
+    ),
+    'moderate': (
+        ('font-semibold', 'Moderate Water Chestnut Coverage ({chestnutCoverage}%)'),
+        (None, 'The floating vegetation is beginning to impact water quality. Light penetration is reduced '
+               'to {waterClarity:0}%, and dissolved oxygen levels are declining.'),
+    ),
+    'low': (
+        ('font-semibold', 'Low Water Chestnut Coverage ({chestnutCoverage}%)'),
+        (None, 'With minimal surface coverage, the aquatic system maintains good water clarity '
+               '({waterClarity:0}%) and healthy dissolved oxygen levels ({dissolvedOxygen:1} mg/L).'),
+    ),
+}
+DIEOFF_TEXT = ('Fall Die-off', 'As water chestnut plants decompose, nutrient availability has increased to '
+                               '{nutrientAvailability:1}, and decomposition rates are elevated at '
+                               '{decompositionRate:1}.')
+LOW_OXYGEN_TEXT = ('Low Oxygen Warning', 'Dissolved oxygen levels are critically low. Aerobic microbes are '
+                                         'declining while anaerobic microbes are increasing, reducing '
+                                         'microbial diversity to {microbialDiversity:0}%.')
+STRATIFICATION_TEXT = ('High Stratification Risk', 'The water column is likely stratified, preventing mixing '
+                                                   'and oxygen exchange between layers.')
+
+FORMATS = ('html', 'text')
+_SLOT = re.compile(r'\{(\w+)(?::(\d))?\}')
+
+
+def bucket_of(chestnutCoverage, season, indicators):
+    """Bucket index of each scenario: coverage band * 8 + die-off * 4 + low oxygen * 2 + stratified."""
+    coverage = np.asarray(chestnutCoverage, dtype=float)
+    band = np.where(coverage > 70, 2, np.where(coverage > 30, 1, 0))
+    dieoff = (engine.season_index(season) == engine.SEASONS.index('fall')) & (coverage > 50)
+    low_oxygen = np.asarray(indicators['dissolvedOxygen']) < 5
+    stratified = np.asarray(indicators['stratificationRisk']) > 60
+    return band * 8 + dieoff * 4 + low_oxygen * 2 + stratified
+
+
+def _paragraphs(bucket):
+    band, flags = divmod(bucket, 8)
+    paragraphs = list(COVERAGE_TEXT[COVERAGE_BANDS[band]])
+    for bit, (title, body) in zip((4, 2, 1), (DIEOFF_TEXT, LOW_OXYGEN_TEXT, STRATIFICATION_TEXT)):
+        if flags & bit:
+            paragraphs.append(('mt-2', title, body))
+    return paragraphs
+
+
+def _render(bucket, fmt):
+    """One bucket as a %-template plus the (field, digits) of each slot, in order."""
+    parts = []
+    for paragraph in _paragraphs(bucket):
+        if len(paragraph) == 3:
+            css, title, body = paragraph
+            parts.append(f'<p class="{css}"><strong>{title}:</strong> {body}</p>' if fmt == 'html'
+                          else f'{title}: {body}')
+        else:
+            css, body = paragraph
+            parts.append((f'<p class="{css}">{body}</p>' if css else f'<p>{body}</p>') if fmt == 'html' else body)
+    text = ('\n' if fmt == 'html' else '\n\n').join(parts)
+    slots = [(name, int(digits) if digits else None) for name, digits in _SLOT.findall(text)]
+    return _SLOT.sub('%s', text.replace('%', '%%')), tuple(slots)
+
+
+TEMPLATES = {fmt: [_render(bucket, fmt) for bucket in range(BUCKETS)] for fmt in FORMATS}
+
+
+def _fixed_exact(value, digits):
+    # JavaScript toFixed: the nearest decimal to the exact binary value, ties away from zero
+    scaled = abs(fractions.Fraction(value)) * 10 ** digits
+    n = int(scaled)
+    if scaled - n >= fractions.Fraction(1, 2):
+        n += 1
+    return n
+
+
+def _fixed_table(name, digits):
+    low, high = engine.LIMITS[name]
+    scale = 10 ** digits
+    if digits == 0:
+        return [str(n) for n in range(int(low * scale), int(high * scale) + 1)]
+    return [f'{n // scale}.{n % scale:0{digits}d}' for n in range(int(low * scale), int(high * scale) + 1)]
+
+
+_TABLES = {}
+
+
+def to_fixed(name, values, digits):
+    """``value.toFixed(digits)`` of clamped indicator values, as a list of strings."""
+    key = (name, digits)
+    if key not in _TABLES:
+        _TABLES[key] = _fixed_table(name, digits)
+    table = _TABLES[key]
+    low = int(engine.LIMITS[name][0] * 10 ** digits)
+    values = np.asarray(values, dtype=float)
+    scaled = values * 10 ** digits
+    n = np.floor(scaled + 0.5).astype(np.int64)
+    # Rows within rounding error of a tie are settled exactly
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+        n[i] = _fixed_exact(float(values[i]), digits)
+    return [table[i] for i in (n - low).tolist()]
+
+
+def js_number(value):
+    """``String(value)`` for a number in the page's range."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _coverage_strings(values):
+    unique, inverse = np.unique(np.asarray(values, dtype=float), return_inverse=True)
+    strings = [js_number(value) for value in unique.tolist()]
+    return [strings[i] for i in inverse.ravel().tolist()]
+
+
+def render(inputs, indicators, fmt='html'):
+    """Narratives of validated inputs and their indicators; returns ``(texts, buckets)``."""
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown format: {fmt}')
+    buckets = bucket_of(inputs['chestnutCoverage'], inputs['season'], indicators)
+    texts = [None] * len(buckets)
+    coverage = np.broadcast_to(inputs['chestnutCoverage'], buckets.shape)
+    for bucket in np.unique(buckets).tolist():
+        template, slots = TEMPLATES[fmt][bucket]
+        rows = np.flatnonzero(buckets == bucket)
+        columns = [_coverage_strings(coverage[rows]) if name == 'chestnutCoverage'
+                   else to_fixed(name, indicators[name][rows], digits)
+                   for name, digits in slots]
+        for row, values in zip(rows.tolist(), zip(*columns)):
+            texts[row] = template % values
+    return texts, buckets
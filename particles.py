@@ -0,0 +1,111 @@
+"""Array-backed microbe particles with a uniform-grid spatial index.
+
+Positions live in the unit square and are stored struct-of-arrays style
+(``x``, ``y``, ``vx``, ``vy``, ``kind``).  After every rebuild the arrays are
+sorted by grid cell, and cells are numbered row by row, so each grid row
+touched by a query is one contiguous slice.  A microscope query only reads
+the few rows under the lens.
+"""
+import struct
+
+import numpy as np
+
+AEROBIC, ANAEROBIC = 0, 1
+
+# Target mean number of particles per grid cell
+CELL_OCCUPANCY = 8
+
+# Header of query responses: magic, version, count
+QUERY_HEADER = struct.Struct('<4sHxxI')
+QUERY_MAGIC = b'TRPM'
+
+
+def aerobic_fraction(dissolvedOxygen, waterMovement):
+    """Share of aerobic cells, using the oxygen ratio rule from simulation.js."""
+    percent = np.clip(np.asarray(dissolvedOxygen) / 10 * 80 + np.asarray(waterMovement) * 5, 10, 90)
+    return percent / 100
+
+
+class ParticleSystem:
+    """``count`` cells scattered uniformly, ``aerobic`` of them aerobic."""
+
+    def __init__(self, count, aerobic=0.5, seed=None):
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+        self.x = rng.random(count, dtype=np.float32)
+        self.y = rng.random(count, dtype=np.float32)
+        self.vx = np.zeros(count, dtype=np.float32)
+        self.vy = np.zeros(count, dtype=np.float32)
+        self.kind = np.where(rng.random(count) < aerobic, AEROBIC, ANAEROBIC).astype(np.uint8)
+        self.grid = max(1, int(np.sqrt(count / CELL_OCCUPANCY)))
+        self.rebuild_index()
+
+    def __len__(self):
+        return len(self.x)
+
+    def rebuild_index(self):
+        """Sort particles by grid cell and record where each cell starts."""
+        g = self.grid
+        col = np.minimum((self.x * g).astype(np.int64), g - 1)
+        row = np.minimum((self.y * g).astype(np.int64), g - 1)
+        cell = row * g + col
+        order = np.argsort(cell, kind='stable')
+        for name in ('x', 'y', 'vx', 'vy', 'kind'):
+            setattr(self, name, getattr(self, name)[order])
+        counts = np.bincount(cell, minlength=g * g)
+        self.cell_start = np.concatenate(([0], np.cumsum(counts)))
+
+    def step(self, dt=1.0, diffusion=0.002, damping=0.9):
+        """Advance a random walk by ``dt`` and re-index; positions wrap around."""
+        n = len(self)
+        kick = np.sqrt(dt) * diffusion
+        self.vx = (self.vx * damping + self.rng.normal(0, kick, n)).astype(np.float32)
+        self.vy = (self.vy * damping + self.rng.normal(0, kick, n)).astype(np.float32)
+        self.x = (self.x + self.vx * dt) % 1
+        self.y = (self.y + self.vy * dt) % 1
+        self.rebuild_index()
+
+    def query(self, x, y, radius):
+        """Indices of particles within ``radius`` of ``(x, y)``."""
+        g = self.grid
+        c0, c1 = (int(np.clip(np.floor(v * g), 0, g - 1)) for v in (x - radius, x + radius))
+        r0, r1 = (int(np.clip(np.floor(v * g), 0, g - 1)) for v in (y - radius, y + radius))
+        if x + radius < 0 or x - radius > 1 or y + radius < 0 or y - radius > 1:
+            return np.empty(0, dtype=np.int64)
+        start = self.cell_start
+        spans = [np.arange(start[r * g + c0], start[r * g + c1 + 1]) for r in range(r0, r1 + 1)]
+        candidates = np.concatenate(spans)
+        dx = self.x[candidates] - x
+        dy = self.y[candidates] - y
+        return candidates[dx * dx + dy * dy <= radius * radius]
+
+    def microscope(self, x, y, r, magnification=1.0, limit=None):
+        """Cells visible through a lens of radius ``r`` at ``magnification``.
+
+        Returns ``(dx, dy, kind)`` with offsets from the lens centre in units
+        of the lens radius, so -1..1 maps straight onto the overlay.
+        """
+        radius = r / magnification
+        hits = self.query(x, y, radius)
+        if limit is not None and len(hits) > limit:
+            # Thin evenly rather than truncating, which would favour the top rows
+            hits = hits[np.linspace(0, len(hits) - 1, limit).astype(np.int64)]
+        dx = (self.x[hits] - x) / radius
+        dy = (self.y[hits] - y) / radius
+        return dx.astype(np.float32), dy.astype(np.float32), self.kind[hits]
+
+
+def encode_query(dx, dy, kind):
+    """Pack a microscope query as header + float32 dx, float32 dy, uint8 kind columns."""
+    return b''.join((
+        QUERY_HEADER.pack(QUERY_MAGIC, 1, len(kind)),
+        np.asarray(dx, dtype='<f4').tobytes(),
+        np.asarray(dy, dtype='<f4').tobytes(),
+        np.asarray(kind, dtype=np.uint8).tobytes(),
+    ))
+
+
+def for_scenario(microbialBiomass, dissolvedOxygen, waterMovement, max_cells, seed=0):
+    """Population sized by biomass, split by oxygen, as in the page's updateMicrobes."""
+    count = int(max_cells * float(microbialBiomass) / 100)
+    return ParticleSystem(count, float(aerobic_fraction(dissolvedOxygen, waterMovement)), seed=seed)
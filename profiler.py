@@ -0,0 +1,58 @@
+"""Opt-in sampling profiler for individual requests.
+
+A sampler thread reads the profiled thread's current stack every
+``interval`` seconds through ``sys._current_frames`` and counts identical
+stacks.  The result is written in the collapsed ("folded") format that
+flamegraph.pl and speedscope read: one ``frame;frame;frame count`` per line.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    """Samples one thread's stack until ``stop`` is called."""
+
+    def __init__(self, thread_id=None, interval=0.001):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def _sample(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def dump(self, directory, name):
+        """Write the collapsed stacks to ``directory`` and return the file path."""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(directory, f'{name}-{stamp}-{self.elapsed * 1000:.0f}ms.folded')
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+        return path
@@ -0,0 +1,191 @@
+"""Global and local sensitivity of the indicators to the model inputs.
+
+Sobol indices use the Saltelli sampling scheme: two independent base
+matrices A and B of N rows, plus one matrix per factor that is A with that
+factor's column taken from B.  All N(k + 2) rows of a chunk are scored in one
+engine call.  First-order indices use the Saltelli (2010) estimator and total
+indices Jansen's; both are means of per-row terms, so chunks only return sums,
+which merge exactly.  Chunks are seeded and pooled the same way as the
+Monte Carlo runs (see montecarlo.py).
+
+Local gradients are central finite differences at one scenario.
+"""
+import numpy as np
+
+import engine
+import montecarlo
+import sweep
+
+CHUNK_SIZE = 50000
+MAX_SAMPLES = 10 ** 7
+
+# Half-width of the finite-difference step, as a fraction of the factor's range
+GRADIENT_STEP = 1e-4
+
+# Two-sided 95% normal quantile for the confidence half-widths
+Z95 = 1.959964
+
+
+def parse_factors(factors=None, ranges=None):
+    """Ranges of the varied inputs: ``(low, high)`` for numeric inputs, season indices for season.
+
+    Factors default to every input over its full slider range.  ``ranges``
+    may narrow a numeric input with ``[low, high]`` or list the seasons to
+    draw from.
+    """
+    if factors is not None and not isinstance(factors, (list, tuple)):
+        raise ValueError('factors must be a list of inputs')
+    if ranges is not None and not isinstance(ranges, dict):
+        raise ValueError('ranges must be an object')
+    factors = list(engine.INPUTS if factors is None else factors)
+    ranges = ranges or {}
+    unknown = (set(factors) | set(ranges)) - set(engine.INPUTS)
+    if unknown:
+        raise ValueError(f'unknown factor: {sorted(unknown)[0]}')
+    if not factors or len(set(factors)) != len(factors):
+        raise ValueError('factors must be a non-empty list of distinct inputs')
+    out = {}
+    for key in factors:
+        if key == 'season':
+            values = engine.season_index(np.asarray(ranges.get(key, engine.SEASONS)).ravel())
+            if values.size == 0:
+                raise ValueError('season range is empty')
+            out[key] = values
+            continue
+        try:
+            low, high = (float(v) for v in ranges.get(key, sweep.SLIDERS[key][:2]))
+        except (TypeError, ValueError):
+            raise ValueError(f'{key} range must be [min, max]')
+        if not high > low:
+            raise ValueError(f'{key} range must have max above min')
+        out[key] = (low, high)
+    return out
+
+
+def _scale(key, spec, u):
+    if key == 'season':
+        return spec[np.minimum((u * len(spec)).astype(np.intp), len(spec) - 1)]
+    low, high = spec
+    return low + u * (high - low)
+
+
+def _run_chunk(seed, size, factors, fixed):
+    rng = np.random.default_rng(seed)
+    keys = list(factors)
+    k = len(keys)
+    a = rng.random((size, k))
+    b = rng.random((size, k))
+    # Rows: A, B, then A with column i from B for each factor i
+    stacked = np.empty((k + 2, size, k))
+    stacked[0], stacked[1] = a, b
+    for i in range(k):
+        stacked[2 + i] = a
+        stacked[2 + i, :, i] = b[:, i]
+    stacked = stacked.reshape(-1, k)
+
+    inputs = {key: np.full(len(stacked), value) for key, value in fixed.items()}
+    for i, key in enumerate(keys):
+        inputs[key] = _scale(key, factors[key], stacked[:, i])
+    indicators = engine.calculate_indicators(**inputs)
+
+    out = {}
+    for name, values in indicators.items():
+        y = values.reshape(k + 2, size)
+        f_a, f_b, f_ab = y[0], y[1], y[2:]
+        first = f_b * (f_ab - f_a)
+        total = 0.5 * np.square(f_a - f_ab)
+        out[name] = {
+            'sum': f_a.sum() + f_b.sum(),
+            'sumsq': np.square(f_a).sum() + np.square(f_b).sum(),
+            'first': first.sum(axis=1),
+            'firstsq': np.square(first).sum(axis=1),
+            'total': total.sum(axis=1),
+            'totalsq': np.square(total).sum(axis=1),
+        }
+    return out
+
+
+def _merge(parts):
+    merged = parts[0]
+    for part in parts[1:]:
+        for name, sums in part.items():
+            for key, value in sums.items():
+                merged[name][key] = merged[name][key] + value
+    return merged
+
+
+def _index(total, totalsq, n, variance):
+    """Index estimate and 95% confidence half-width from summed per-row terms."""
+    mean = total / n
+    spread = np.sqrt(np.maximum(totalsq / n - mean * mean, 0) / n)
+    return mean / variance, Z95 * spread / variance
+
+
+def sobol(scenario, samples, factors=None, ranges=None, seed=None, parallel=True):
+    """First-order and total Sobol indices of every indicator."""
+    if not 0 < samples <= MAX_SAMPLES:
+        raise ValueError(f'samples must be between 1 and {MAX_SAMPLES}')
+    factors = parse_factors(factors, ranges)
+    fixed = engine.validate_inputs({key: scenario.get(key, engine.DEFAULTS[key]) for key in engine.INPUTS})
+    fixed = {key: value for key, value in fixed.items() if key not in factors}
+    if any(np.ndim(value) != 0 for value in fixed.values()):
+        raise ValueError('fixed inputs must be single values')
+
+    root = np.random.SeedSequence(seed)
+    sizes = [min(CHUNK_SIZE, samples - start) for start in range(0, samples, CHUNK_SIZE)]
+    seeds = root.spawn(len(sizes))
+    args = [(s, n, factors, fixed) for s, n in zip(seeds, sizes)]
+    if parallel and len(sizes) > 1:
+        parts = list(montecarlo.get_executor().map(_run_chunk, *zip(*args)))
+    else:
+        parts = [_run_chunk(*a) for a in args]
+    merged = _merge(parts)
+
+    result = {}
+    for name, sums in merged.items():
+        mean = sums['sum'] / (2 * samples)
+        variance = sums['sumsq'] / (2 * samples) - mean * mean
+        entry = {'variance': max(float(variance), 0.0)}
+        if variance <= 1e-12 * max(1.0, mean * mean):
+            # A constant indicator has no variance to apportion
+            for key in ('first', 'firstConf', 'total', 'totalConf'):
+                entry[key] = {factor: None for factor in factors}
+        else:
+            first, first_conf = _index(sums['first'], sums['firstsq'], samples, variance)
+            total, total_conf = _index(sums['total'], sums['totalsq'], samples, variance)
+            for key, values in (('first', first), ('firstConf', first_conf),
+                                ('total', total), ('totalConf', total_conf)):
+                entry[key] = {factor: float(v) for factor, v in zip(factors, values)}
+        result[name] = entry
+    return {
+        'samples': samples,
+        'evaluations': samples * (len(factors) + 2),
+        'seed': str(root.entropy),
+        'factors': list(factors),
+        'indicators': result,
+    }
+
+
+def gradients(scenario, factors=None):
+    """Central-difference derivatives of every indicator with respect to each numeric input.
+
+    Steps are scaled to each input's slider range; all points are scored in
+    one engine call.
+    """
+    base = engine.validate_inputs({key: scenario.get(key, engine.DEFAULTS[key]) for key in engine.INPUTS})
+    if any(np.ndim(value) != 0 for value in base.values()):
+        raise ValueError('gradients need a single scenario')
+    keys = [key for key in (engine.INPUTS if factors is None else factors) if key != 'season']
+    unknown = set(keys) - set(engine.INPUTS)
+    if unknown:
+        raise ValueError(f'unknown factor: {sorted(unknown)[0]}')
+    steps = np.array([GRADIENT_STEP * (sweep.SLIDERS[key][1] - sweep.SLIDERS[key][0]) for key in keys])
+    inputs = {key: np.full(2 * len(keys), value) for key, value in base.items()}
+    for i, key in enumerate(keys):
+        inputs[key][2 * i] += steps[i]
+        inputs[key][2 * i + 1] -= steps[i]
+    indicators = engine.calculate_indicators(**inputs)
+    return {
+        name: {key: float(d) for key, d in zip(keys, (values[0::2] - values[1::2]) / (2 * steps))}
+        for name, values in indicators.items()
+    }
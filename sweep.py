@@ -0,0 +1,143 @@
+"""Chunked parameter sweeps over the slider grid.
+
+The grid is never materialized: each chunk is a range of flat grid indices
+unravelled into input arrays, scored by the engine and handed to the caller,
+so memory stays at one chunk regardless of sweep size.
+"""
+import math
+
+import numpy as np
+
+import columnar
+import engine
+
+# Slider ranges from the inline page: (min, max, step)
+SLIDERS = {
+    'waterDepth': (0.5, 5.0, 0.1),
+    'chestnutCoverage': (0, 100, 1),
+    'nutrientLevel': (1, 10, 1),
+    'waterMovement': (1, 10, 1),
+}
+
+DEFAULT_CHUNK_SIZE = 65536
+MAX_CHUNK_SIZE = 1 << 20
+
+# Upper bound on the rows of one sweep, so flat indices stay well inside int64
+MAX_ROWS = 10 ** 12
+
+# Column order of binary sweep frames
+COLUMNS = engine.INPUTS + engine.INDICATORS
+
+
+class Range:
+    """Axis of evenly spaced values, computed per chunk instead of stored.
+
+    Indexing with an array of positions returns their values, rounded so
+    0.1 steps land on exact grid points; a slice returns a shorter Range.
+    """
+
+    def __init__(self, low, step, count):
+        self.low, self.step, self.count = low, step, count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            positions = range(self.count)[index]
+            return Range(self.low + positions.start * self.step, positions.step * self.step, len(positions))
+        return np.round(self.low + np.asarray(index) * self.step, 10)
+
+
+def slider_values(low, high, step):
+    """The slider range from ``low`` to ``high`` as a :class:`Range`."""
+    if not np.isfinite([low, high, step]).all():
+        raise ValueError('min, max and step must be finite')
+    if step <= 0:
+        raise ValueError('step must be positive')
+    if high < low:
+        raise ValueError('max must not be below min')
+    count = np.floor((high - low) / step + 1e-9) + 1
+    if count > MAX_ROWS:
+        raise ValueError(f'axis has more than {MAX_ROWS} values')
+    return Range(low, step, int(count))
+
+
+def full_grid():
+    """Axes of the complete slider grid, in engine.INPUTS order."""
+    axes = {key: slider_values(*SLIDERS[key]) for key in SLIDERS}
+    axes['season'] = np.arange(len(engine.SEASONS))
+    return axes
+
+
+def parse_axes(spec):
+    """Build axes from a request spec.
+
+    Each input may be omitted (full slider range), a ``{min, max, step}``
+    object (missing fields default to the slider's), a list of values, or a
+    single value.
+    """
+    spec = spec or {}
+    unknown = set(spec) - set(engine.INPUTS)
+    if unknown:
+        raise ValueError(f'unknown axis: {sorted(unknown)[0]}')
+    axes = full_grid()
+    for key, value in spec.items():
+        if key == 'season':
+            values = value if isinstance(value, list) else [value]
+            axes[key] = engine.season_index(np.asarray(values))
+        elif isinstance(value, dict):
+            low, high, step = SLIDERS[key]
+            axes[key] = slider_values(float(value.get('min', low)), float(value.get('max', high)),
+                                      float(value.get('step', step)))
+        elif isinstance(value, list):
+            try:
+                axes[key] = np.asarray(value, dtype=float)
+            except (TypeError, ValueError):
+                raise ValueError(f'{key} values must be numeric')
+        else:
+            try:
+                axes[key] = np.asarray([value], dtype=float)
+            except (TypeError, ValueError):
+                raise ValueError(f'{key} must be numeric')
+        if not isinstance(axes[key], Range) and (axes[key].ndim != 1 or axes[key].size == 0):
+            raise ValueError(f'{key} axis is empty')
+    if grid_size(axes) > MAX_ROWS:
+        raise ValueError(f'sweep has more than {MAX_ROWS} rows')
+    return {key: axes[key] for key in engine.INPUTS}
+
+
+def grid_size(axes):
+    return math.prod(len(axes[key]) for key in engine.INPUTS)
+
+
+def iter_chunks(axes, chunk_size=DEFAULT_CHUNK_SIZE, dtype=np.float64):
+    """Yield ``(inputs, indicators)`` for consecutive chunks of the grid.
+
+    Scenarios are ordered with season varying fastest and depth slowest.
+    """
+    shape = tuple(len(axes[key]) for key in engine.INPUTS)
+    total = grid_size(axes)
+    for start in range(0, total, chunk_size):
+        flat = np.arange(start, min(start + chunk_size, total), dtype=np.int64)
+        index = np.unravel_index(flat, shape)
+        inputs = {key: axes[key][i] for key, i in zip(engine.INPUTS, index)}
+        yield inputs, engine.calculate_indicators(**inputs, dtype=dtype)
+
+
+def ndjson_lines(axes, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream the sweep as NDJSON, one scenario object per line."""
+    fields = engine.INPUTS + engine.INDICATORS
+    template = '{' + ','.join(f'"{name}":%s' for name in fields) + '}'
+    seasons = np.asarray([f'"{name}"' for name in engine.SEASONS])
+    for inputs, indicators in iter_chunks(axes, chunk_size):
+        columns = [inputs[key].tolist() for key in engine.INPUTS[:-1]]
+        columns.append(seasons[inputs['season']].tolist())
+        columns.extend(indicators[name].tolist() for name in engine.INDICATORS)
+        yield ''.join(template % row + '\n' for row in zip(*columns))
+
+
+def binary_frames(axes, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream the sweep as columnar frames (see columnar.py), one per chunk."""
+    for inputs, indicators in iter_chunks(axes, chunk_size, dtype=np.float32):
+        yield columnar.encode({**inputs, **indicators})
@@ -0,0 +1,158 @@
+"""Precomputed indicator table for the full slider grid.
+
+``python table.py build [path]`` scores every depth x coverage x nutrient x
+movement x season combination once and writes the results as a float32
+``.npy`` array of shape ``(46, 101, 10, 10, 4, 8)``.  The server opens it
+read-only with ``numpy.memmap``, so every worker shares one page-cache copy,
+and answers on-grid scenarios by index arithmetic instead of recomputing.
+"""
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+import engine
+import metrics
+import sweep
+
+DEFAULT_PATH = 'indicator_table.npy'
+
+# Tolerance for treating an input as lying on a slider step
+GRID_TOLERANCE = 1e-6
+
+
+def _meta_path(path):
+    return path + '.json'
+
+
+def build(path=DEFAULT_PATH, chunk_size=sweep.DEFAULT_CHUNK_SIZE):
+    """Write the table for the current coefficients to ``path``."""
+    axes = sweep.full_grid()
+    shape = tuple(len(axes[key]) for key in engine.INPUTS) + (len(engine.INDICATORS),)
+    tmp = path + '.tmp'
+    out = np.lib.format.open_memmap(tmp, mode='w+', dtype='<f4', shape=shape)
+    rows = out.reshape(-1, len(engine.INDICATORS))
+    start = 0
+    for _, indicators in sweep.iter_chunks(axes, chunk_size, dtype=np.float32):
+        stop = start + len(indicators[engine.INDICATORS[0]])
+        for i, name in enumerate(engine.INDICATORS):
+            rows[start:stop, i] = indicators[name]
+        start = stop
+    out.flush()
+    del rows, out
+
+    meta = {
+        'modelVersion': engine.model_version(),
+        'inputs': list(engine.INPUTS),
+        'indicators': list(engine.INDICATORS),
+        'sliders': {key: list(value) for key, value in sweep.SLIDERS.items()},
+        'seasons': list(engine.SEASONS),
+    }
+    with open(_meta_path(tmp), 'w') as f:
+        json.dump(meta, f, indent=2)
+    # Replace atomically so running workers never map a half-written file
+    os.replace(_meta_path(tmp), _meta_path(path))
+    os.replace(tmp, path)
+    return shape
+
+
+class IndicatorTable:
+    """Read-only view of a built table with an engine-compatible interface."""
+
+    def __init__(self, path):
+        with open(_meta_path(path)) as f:
+            meta = json.load(f)
+        if meta['modelVersion'] != engine.model_version():
+            raise ValueError(f'{path} was built for model {meta["modelVersion"]}, '
+                             f'current model is {engine.model_version()}')
+        self.path = path
+        self.version = meta['modelVersion']
+        self.data = np.load(path, mmap_mode='r')
+        self.rows = self.data.reshape(-1, self.data.shape[-1])
+        self.strides = tuple(int(n) for n in np.cumprod((self.data.shape[1:-1] + (1,))[::-1])[::-1])
+
+    def lookup_one(self, waterDepth, chestnutCoverage, nutrientLevel, waterMovement, season):
+        """Scalar fast path: the indicator row of one scenario, or None if off the grid."""
+        flat = 0
+        for axis, (key, value) in enumerate(zip(engine.INPUTS[:-1], (waterDepth, chestnutCoverage,
+                                                                     nutrientLevel, waterMovement))):
+            low, _, step = sweep.SLIDERS[key]
+            i = (value - low) / step
+            if not math.isfinite(i):
+                return None
+            i = round(i)
+            if not 0 <= i < self.data.shape[axis] or abs(low + i * step - value) >= GRID_TOLERANCE:
+                return None
+            flat += i * self.strides[axis]
+        return self.rows[flat + int(season)]
+
+    def grid_index(self, waterDepth, chestnutCoverage, nutrientLevel, waterMovement, season):
+        """Flat row index of each scenario, or -1 where it is off the grid."""
+        season = engine.season_index(season)
+        values = np.broadcast_arrays(waterDepth, chestnutCoverage, nutrientLevel, waterMovement, season)
+        flat = np.zeros(values[0].shape, dtype=np.int64)
+        on_grid = np.ones(values[0].shape, dtype=bool)
+        for axis, (key, value) in enumerate(zip(engine.INPUTS, values)):
+            if key == 'season':
+                i = value.astype(np.int64)
+            else:
+                low, _, step = sweep.SLIDERS[key]
+                value = np.asarray(value, dtype=float)
+                i = np.rint((value - low) / step).astype(np.int64)
+                on_grid &= np.abs(low + i * step - value) < GRID_TOLERANCE
+            on_grid &= (i >= 0) & (i < self.data.shape[axis])
+            flat += i * self.strides[axis]
+        flat[~on_grid] = -1
+        return flat
+
+    def calculate_indicators(self, waterDepth, chestnutCoverage, nutrientLevel, waterMovement, season,
+                             dtype=np.float64):
+        """Drop-in for engine.calculate_indicators; off-grid rows use the live engine."""
+        inputs = (waterDepth, chestnutCoverage, nutrientLevel, waterMovement, season)
+        if all(np.ndim(value) == 1 and len(value) == 1 for value in inputs):
+            values = [float(value[0]) for value in inputs[:-1]]
+            row = self.lookup_one(*values, engine.season_index(season)[0])
+            if row is not None:
+                metrics.CACHE_LOOKUPS.inc(cache='table', result='hit')
+                if dtype != np.float32:
+                    row = np.round(row.astype(dtype), engine.OUTPUT_DECIMALS)
+                return {name: row[i:i + 1] for i, name in enumerate(engine.INDICATORS)}
+        flat = self.grid_index(*inputs)
+        hit = flat >= 0
+        hits = int(np.count_nonzero(hit))
+        metrics.CACHE_LOOKUPS.inc(hits, cache='table', result='hit')
+        metrics.CACHE_LOOKUPS.inc(hit.size - hits, cache='table', result='miss')
+        block = self.rows[flat[hit]]
+        if dtype != np.float32:
+            # float32 carries ~7 significant digits; drop the representation noise
+            block = np.round(block.astype(dtype), engine.OUTPUT_DECIMALS)
+        result = {name: np.empty(flat.shape, dtype=dtype) for name in engine.INDICATORS}
+        for i, name in enumerate(engine.INDICATORS):
+            result[name][hit] = block[:, i]
+        if not hit.all():
+            miss = ~hit
+            arrays = np.broadcast_arrays(*inputs[:-1], engine.season_index(season))
+            live = engine.calculate_indicators(*(a[miss] for a in arrays), dtype=dtype)
+            for name in engine.INDICATORS:
+                result[name][miss] = live[name]
+        return result
+
+
+def open_table(path):
+    """Open a table if it exists and matches the current model, else None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return IndicatorTable(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f'Ignoring indicator table: {e}', file=sys.stderr)
+        return None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        sys.exit('usage: python table.py build [path]')
+    target = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH
+    print(f'Wrote {target} with shape {build(target)}')
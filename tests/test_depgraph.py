@@ -0,0 +1,66 @@
+import itertools
+
+import numpy as np
+
+import depgraph
+import engine
+
+# Covers both sides of the die-off threshold, low oxygen and every clamp
+GRID = {
+    'waterDepth': (0.5, 2.0, 5.0),
+    'chestnutCoverage': (0, 45, 50, 51, 100),
+    'nutrientLevel': (1, 5, 10),
+    'waterMovement': (1, 10),
+    'season': engine.SEASONS,
+}
+
+
+def _scenarios():
+    for values in itertools.product(*GRID.values()):
+        yield dict(zip(GRID, values))
+
+
+def _engine(scenario, coefficients=None):
+    indicators = engine.calculate_indicators(**{key: np.asarray([value]) for key, value in scenario.items()},
+                                             coefficients=coefficients)
+    return {name: float(values[0]) for name, values in indicators.items()}
+
+
+def test_session_matches_engine():
+    for scenario in _scenarios():
+        assert depgraph.Session(scenario).indicators == _engine(scenario)
+
+
+def test_incremental_updates_match_engine():
+    session = depgraph.Session()
+    for scenario in _scenarios():
+        session.update(scenario)
+        assert session.indicators == _engine(scenario)
+
+
+def test_session_with_other_coefficients():
+    coefficients = dict(engine.COEFFICIENTS, dieoff_coverage=20.0, low_o2_threshold=9.0,
+                        season_temp=(10.0, 30.0, 20.0, 0.0))
+    for scenario in _scenarios():
+        assert depgraph.Session(scenario, coefficients).indicators == _engine(scenario, coefficients)
+
+
+def test_depth_change_recomputes_only_its_indicators():
+    session = depgraph.Session({'nutrientLevel': 8, 'season': 'fall', 'chestnutCoverage': 80})
+    before = session.recomputed
+    changed = session.update({'waterDepth': 3.1})
+    assert set(changed) == {'waterClarity', 'stratificationRisk'}
+    # Only the two nodes that read depth; nutrient availability and the rest are untouched
+    assert session.recomputed - before == 2
+
+
+def test_coverage_change_below_dieoff_stops_early():
+    session = depgraph.Session({'season': 'fall', 'chestnutCoverage': 10})
+    before = session.recomputed
+    changed = session.update({'chestnutCoverage': 11})
+    assert 'decompositionRate' not in changed and 'nutrientAvailability' not in changed
+    # dieoffCoverage stays 0 and the oxygen deficit stays 0, so only the die-off, oxygen,
+    # clarity, sediment and stratification nodes run, not nutrient, decomposition or microbial ones
+    recomputed = ('dieoffCoverage', 'dissolvedOxygenRaw', 'o2Deficit', 'dissolvedOxygen',
+                  'waterClarity', 'sedimentOxygen', 'stratificationRisk')
+    assert session.recomputed - before == len(recomputed)
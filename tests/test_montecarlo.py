@@ -0,0 +1,20 @@
+import montecarlo
+
+
+def test_percentiles_do_not_bridge_empty_bins():
+    # Coverage of 0 or 100 gives a water clarity of exactly 80 or 20, nothing in between
+    result = montecarlo.run({}, {'chestnutCoverage': {'dist': 'choice', 'values': [0, 100]}}, 10000,
+                            seed=1, parallel=False)
+    clarity = result['indicators']['waterClarity']
+    bin_width = 100 / montecarlo.FINE_BINS
+    for value in clarity['percentiles'].values():
+        assert min(abs(value - 20), abs(value - 80)) <= bin_width
+
+
+def test_percentiles_of_a_uniform_input():
+    result = montecarlo.run({}, {'chestnutCoverage': {'dist': 'uniform', 'low': 0, 'high': 100}}, 100000,
+                            seed=1, parallel=False)
+    percentiles = result['indicators']['waterClarity']['percentiles']
+    # Clarity is 80 - 0.6 * coverage, so uniform on [20, 80]
+    for p, value in percentiles.items():
+        assert abs(value - (20 + 0.6 * float(p))) < 0.5